@@ -0,0 +1,71 @@
+"""
+Startup-time benchmark for the CLI entry point.
+Runs `main.py --help` (argument parsing only) and the import of the processing pipeline in fresh
+interpreters and reports the median wall clock of each. With --max-seconds the script exits with
+status 1 when a median exceeds the budget, so it can be used to catch startup regressions.
+
+Usage:
+    uv run benchmarks/startup_time.py [--runs 10] [--max-seconds 0.5]
+"""
+
+from argparse import ArgumentParser
+from pathlib import Path
+from statistics import median
+from time import perf_counter
+import subprocess
+import sys
+
+ROOT_DIR = Path(__file__).parent.parent.resolve()
+
+# Modules that must not be loaded just to start the CLI
+HEAVY_MODULES = ["streamlit", "pandas", "plotly", "openai"]
+
+SCENARIOS = {
+    "cli_help": [sys.executable, "main.py", "--help"],
+    "import_pipeline": [sys.executable, "-c", "import utils.pipeline"],
+}
+
+def time_command(command: list[str], runs: int) -> float:
+    """
+    Return the median wall clock (in seconds) of running command `runs` times.
+    """
+    timings = list()
+    for _ in range(runs):
+        start = perf_counter()
+        subprocess.run(command, cwd=ROOT_DIR, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append(perf_counter() - start)
+    return median(timings)
+
+def loaded_heavy_modules() -> list[str]:
+    """
+    Return the heavy modules loaded as a side effect of importing the CLI and the pipeline.
+    """
+    check = (
+        "import sys, main, utils.pipeline; "
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    output = subprocess.run([sys.executable, "-c", check], cwd=ROOT_DIR, check=True, capture_output=True, text=True)
+    return [m for m in output.stdout.strip().split(",") if m]
+
+def main():
+    parser = ArgumentParser(description="Benchmark de tempo de inicialização do CLI.")
+    parser.add_argument("--runs", type=int, default=10, help="Número de execuções por cenário (default: 10).")
+    parser.add_argument("--max-seconds", type=float, default=None, help="Falha se a mediana de algum cenário exceder esse valor.")
+    args = parser.parse_args()
+
+    failed = False
+    for name, command in SCENARIOS.items():
+        elapsed = time_command(command, args.runs)
+        over_budget = args.max_seconds is not None and elapsed > args.max_seconds
+        failed = failed or over_budget
+        print(f"{name:<20} median {elapsed:.3f}s over {args.runs} runs{'  (OVER BUDGET)' if over_budget else ''}")
+
+    heavy = loaded_heavy_modules()
+    if heavy:
+        failed = True
+        print(f"Heavy modules loaded at startup: {', '.join(heavy)}")
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
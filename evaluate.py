@@ -0,0 +1,64 @@
+"""
+Offline evaluation of results files against the reference targets.
+Computes per-key/per-label accuracy (with the normalization used by PDF2Matrix) next to latency,
+tokens and cost, and reports the accuracy-vs-cost Pareto front of the compared configurations.
+No LLM call is made: only the stored results (from real, cached or mocked responses) are read.
+
+Usage:
+    uv run evaluate.py results_A.json results_B.json [--targets target/dataset_targets.json] [--group-by run|route]
+"""
+
+from argparse import ArgumentParser
+from glob import glob
+import json
+import sys
+
+from utils.evaluation import load_targets, evaluate_results
+
+def format_value(value, fmt: str) -> str:
+    return "-" if value is None else format(value, fmt)
+
+def print_report(report: dict) -> None:
+    pareto = set(report["pareto"])
+    header = f"{'configuração':<40} {'docs':>5} {'falhas':>6} {'acurácia':>9} {'lat. média':>11} {'lat. p95':>9} {'tokens':>8} {'custo médio':>12} {'pareto':>7}"
+    print(header)
+    print("-" * len(header))
+    for name, config in sorted(report["configurations"].items(), key=lambda c: c[1]["summary"]["mean_cost_usd"] or 0):
+        s = config["summary"]
+        print(
+            f"{name:<40} {s['documents']:>5} {s['failed_documents']:>6} {format_value(s['accuracy'], '.2%'):>9} "
+            f"{format_value(s['mean_latency_seconds'], '.2f'):>11} {format_value(s['p95_latency_seconds'], '.2f'):>9} "
+            f"{format_value(s['mean_total_tokens'], '.0f'):>8} {format_value(s['mean_cost_usd'], '.3e'):>12} "
+            f"{'*' if name in pareto else '':>7}"
+        )
+
+    for name, config in sorted(report["configurations"].items()):
+        print(f"\n== {name}")
+        for label, s in config["labels"].items():
+            print(f"  {label:<38} acurácia {format_value(s['accuracy'], '.2%'):>8}  latência {format_value(s['mean_latency_seconds'], '.2f')}s")
+        for key, accuracy in config["keys"].items():
+            print(f"    {key:<36} {format_value(accuracy, '.2%'):>8}")
+
+def main():
+    parser = ArgumentParser(description="Avalia arquivos de resultados contra o gabarito (acurácia x custo x latência).")
+    parser.add_argument("results", nargs="*", help="Arquivos results_*.json a comparar (default: todos em ./).")
+    parser.add_argument("--targets", default="target/dataset_targets.json", help="JSON com o gabarito (default: target/dataset_targets.json).")
+    parser.add_argument("--group-by", choices=["run", "route"], default="run",
+                        help="Agrupa configurações por arquivo de resultados (run) ou por rota de extração (route).")
+    parser.add_argument("--output", default=None, help="Salva o relatório completo em JSON.")
+    args = parser.parse_args()
+
+    results = args.results or sorted(glob("results_*.json"))
+    if not results:
+        print("Nenhum arquivo de resultados encontrado.", file=sys.stderr)
+        sys.exit(1)
+
+    report = evaluate_results(results, load_targets(args.targets), group_by=args.group_by)
+    print_report(report)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4, ensure_ascii=False)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Upload-once behaviour of FileHandleCache, exercised offline with LocalFilesBackend.
+"""
+from io import BytesIO
+from pathlib import Path
+
+import pytest
+
+from utils.file_handles import FileHandleCache, LocalFilesBackend
+
+pypdf = pytest.importorskip("pypdf")
+
+FILES_DIR = Path(__file__).resolve().parent.parent / "files"
+
+@pytest.fixture
+def pdf_path(tmp_path):
+    """
+    Three-page PDF made of sample files, so that trimming has pages to drop.
+    """
+    writer = pypdf.PdfWriter()
+    for name in ("oab_1.pdf", "oab_2.pdf", "tela_sistema_1.pdf"):
+        writer.add_page(pypdf.PdfReader(FILES_DIR / name).pages[0])
+    path = tmp_path / "sample.pdf"
+    with open(path, "wb") as f:
+        writer.write(f)
+    return path
+
+@pytest.fixture
+def backend(tmp_path):
+    return LocalFilesBackend(tmp_path / "uploads")
+
+def page_count(data: bytes) -> int:
+    return len(pypdf.PdfReader(BytesIO(data)).pages)
+
+def test_uploads_once_per_content(backend, pdf_path, tmp_path):
+    cache = FileHandleCache(backend, index_path=None)
+
+    file_id, uploaded = cache.get_or_upload("hash-a", pdf_path)
+    assert uploaded
+    assert cache.get_or_upload("hash-a", pdf_path) == (file_id, False)
+
+    # Same content under another name: the hash, not the path, identifies the upload
+    copy_path = tmp_path / "copy.pdf"
+    copy_path.write_bytes(pdf_path.read_bytes())
+    assert cache.get_or_upload("hash-a", copy_path) == (file_id, False)
+
+    assert backend.upload_count == 1
+    assert backend.read(file_id) == pdf_path.read_bytes()
+
+def test_handles_are_reused_across_runs(backend, pdf_path, tmp_path):
+    index_path = tmp_path / "cache" / "file_handles.json"
+    file_id, _ = FileHandleCache(backend, index_path=index_path).get_or_upload("hash-a", pdf_path)
+
+    assert FileHandleCache(backend, index_path=index_path).get_or_upload("hash-a", pdf_path) == (file_id, False)
+    assert backend.upload_count == 1
+
+def test_trimmed_pages_are_a_separate_upload(backend, pdf_path):
+    cache = FileHandleCache(backend, index_path=None)
+
+    full_id, _ = cache.get_or_upload("hash-a", pdf_path)
+    trimmed_id, uploaded = cache.get_or_upload("hash-a", pdf_path, pages=[2, 0])
+    assert uploaded and trimmed_id != full_id
+    assert page_count(backend.read(trimmed_id)) == 2
+
+    # Order and repetitions of the pages don't matter, the page set does
+    assert cache.get_or_upload("hash-a", pdf_path, pages=[0, 2, 2]) == (trimmed_id, False)
+    single_id, uploaded = cache.get_or_upload("hash-a", pdf_path, pages=[1])
+    assert uploaded and page_count(backend.read(single_id)) == 1
+    assert backend.upload_count == 3
+
+def test_invalidate_forces_a_new_upload(backend, pdf_path):
+    cache = FileHandleCache(backend, index_path=None)
+    file_id, _ = cache.get_or_upload("hash-a", pdf_path)
+
+    cache.invalidate("file-unknown")
+    assert cache.get_or_upload("hash-a", pdf_path) == (file_id, False)
+
+    cache.invalidate(file_id)
+    _, uploaded = cache.get_or_upload("hash-a", pdf_path)
+    assert uploaded
+    assert backend.upload_count == 2
+
+def test_concurrent_caches_merge_their_handles(backend, pdf_path, tmp_path):
+    index_path = tmp_path / "file_handles.json"
+    first = FileHandleCache(backend, index_path=index_path)
+    second = FileHandleCache(backend, index_path=index_path) # Loaded before first saves anything
+
+    first_id, _ = first.get_or_upload("hash-a", pdf_path)
+    second_id, _ = second.get_or_upload("hash-b", pdf_path, pages=[0])
+    assert second.get_or_upload("hash-a", pdf_path) == (first_id, False) # Adopted on save
+
+    first.invalidate(first_id)
+    reloaded = FileHandleCache(backend, index_path=index_path)
+    assert reloaded.get_or_upload("hash-b", pdf_path, pages=[0]) == (second_id, False)
+    assert backend.upload_count == 2
+    assert reloaded.get_or_upload("hash-a", pdf_path)[1]
+
+class FakeResponses:
+    """
+    Stand-in for client.responses: records the file ids sent and raises the queued errors first.
+    """
+    def __init__(self):
+        self.errors = list()
+        self.file_ids = list()
+
+    def parse(self, **kwargs):
+        self.file_ids.append(kwargs["input"][0]["content"][1]["file_id"])
+        if self.errors:
+            raise self.errors.pop(0)
+        return "response"
+
+class FakeClient:
+    def __init__(self):
+        self.responses = FakeResponses()
+
+def api_error(error_class, message: str):
+    # Built without an HTTP response: only the type and the message matter to the extractor
+    error = error_class.__new__(error_class)
+    Exception.__init__(error, message)
+    return error
+
+@pytest.fixture
+def extractor(backend):
+    pytest.importorskip("openai")
+    from utils.LLM import LLMExtractor
+
+    extractor = LLMExtractor(file_backend=backend, file_handles_path=None)
+    extractor._LLMExtractor__client = FakeClient()
+    return extractor
+
+def test_native_pdf_uploads_again_when_file_is_not_found(extractor, backend, pdf_path):
+    import openai
+
+    schema = {"nome": "Nome do profissional"}
+    responses = extractor._LLMExtractor__client.responses
+
+    assert extractor.extract_from_native_pdf_file(schema, pdf_path, content_hash="hash-a") == "response"
+    assert backend.upload_count == 1
+
+    responses.errors.append(api_error(openai.NotFoundError, "No such File object"))
+    assert extractor.extract_from_native_pdf_file(schema, pdf_path, content_hash="hash-a") == "response"
+    assert backend.upload_count == 2
+    assert len(responses.file_ids) == 3
+
+def test_native_pdf_does_not_upload_again_on_other_errors(extractor, backend, pdf_path):
+    import openai
+
+    schema = {"nome": "Nome do profissional"}
+    responses = extractor._LLMExtractor__client.responses
+    extractor.extract_from_native_pdf_file(schema, pdf_path, content_hash="hash-a")
+
+    responses.errors.append(api_error(openai.RateLimitError, "Rate limit reached"))
+    with pytest.raises(openai.RateLimitError):
+        extractor.extract_from_native_pdf_file(schema, pdf_path, content_hash="hash-a")
+    assert backend.upload_count == 1
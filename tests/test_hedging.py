@@ -0,0 +1,51 @@
+"""
+Hedger behaviour with slow calls, using sleeps instead of API requests.
+"""
+import threading
+from time import sleep, time
+
+from utils.hedging import Hedger
+
+KEY = ("carteira_oab", "text_based")
+
+def warmed_up_hedger(**kwargs) -> Hedger:
+    hedger = Hedger(min_samples=3, max_hedge_ratio=1.0, **kwargs)
+    for _ in range(3):
+        hedger.run(KEY, lambda timeout: sleep(0.01), cost_of=lambda result: 0.0)
+    return hedger
+
+def test_timeout_is_a_multiple_of_the_deadline():
+    hedger = Hedger(min_samples=3, timeout_factor=4.0)
+    timeouts = list()
+    for _ in range(4):
+        hedger.run(KEY, lambda timeout: timeouts.append(timeout), cost_of=lambda result: 0.0)
+
+    assert timeouts[:3] == [None, None, None] # No deadline yet: the client's default
+    assert 0 < timeouts[3] < 0.1
+
+def test_requests_do_not_wait_behind_losers():
+    hedger = warmed_up_hedger(max_workers=2)
+    release = threading.Event()
+    calls = list()
+
+    def slow_then_fast():
+        calls.append(None)
+        if len(calls) == 1: # The primary hangs until released, the hedge answers
+            release.wait(5)
+        return len(calls)
+
+    result, info = hedger.run(KEY, lambda timeout: slow_then_fast(), cost_of=lambda result: 0.0)
+    assert info.fired and info.won and result == 2
+
+    # The losing primary still holds a worker; fill the other one too
+    blocker = threading.Thread(target=hedger.run, args=(KEY, lambda timeout: release.wait(5), lambda result: 0.0))
+    blocker.start()
+    sleep(0.05)
+
+    start_time = time()
+    result, info = hedger.run(KEY, lambda timeout: "answer", cost_of=lambda result: 0.0)
+    assert result == "answer" and not info.fired
+    assert time() - start_time < 1 # Ran in the caller's thread instead of queueing
+
+    release.set()
+    blocker.join()
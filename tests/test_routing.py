@@ -0,0 +1,30 @@
+"""
+Persistence of the routing statistics shared by concurrent runs.
+"""
+import pytest
+
+from utils.routing import RoutingPolicy, ROUTES
+
+TEXT_MINIMAL, _, NATIVE_MINIMAL = ROUTES
+
+def test_save_adds_what_each_run_observed(tmp_path):
+    stats_path = tmp_path / "routing_stats.json"
+    first = RoutingPolicy(stats_path=stats_path)
+    second = RoutingPolicy(stats_path=stats_path) # Loaded before first saves anything
+
+    first.observe("carteira_oab", TEXT_MINIMAL, latency_seconds=2.0, cost_usd=0.001, total_tokens=100, accuracy=1.0)
+    first.save()
+    second.observe("carteira_oab", TEXT_MINIMAL, latency_seconds=4.0, cost_usd=0.003, total_tokens=300)
+    second.observe("tela_sistema", NATIVE_MINIMAL, latency_seconds=6.0, cost_usd=0.002, total_tokens=200)
+    second.save()
+
+    # Saving again without new observations adds nothing
+    first.save()
+
+    stats = RoutingPolicy(stats_path=stats_path).get_stats("carteira_oab", TEXT_MINIMAL)
+    assert stats.count == 2
+    assert stats.tokens_sum == 400
+    assert stats.mean_latency() == pytest.approx(3.0)
+    assert stats.accuracy_count == 1
+    assert RoutingPolicy(stats_path=stats_path).get_stats("tela_sistema", NATIVE_MINIMAL).count == 1
+    assert first.get_stats("tela_sistema", NATIVE_MINIMAL).count == 1 # Adopted on save
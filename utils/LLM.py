@@ -2,16 +2,16 @@
 LLM-related utilities for information extraction from PDFs.
 """
 
-from utils.heuristic import Heuristic
+from utils.file_handles import FileHandleCache, OpenAIFilesBackend
+from utils.pdf_index import file_content_hash
+from utils.pdf2mat import render_matrix
 
-from openai import OpenAI
 import os
 from pathlib import Path
-from pydantic import create_model
 from typing import Optional
 import yaml
 import logging
-import base64
+import threading
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -66,9 +66,76 @@ Sua tarefa é retornar um json, e somente um json, preenchendo os campos solicit
 Comece.
 """
 
+def build_output_model(keys):
+    """
+    Build the pydantic model used as structured output (one optional string per key).
+    pydantic is imported here so that merely importing this module stays cheap.
+    """
+    from pydantic import create_model
+
+    output_structure = {key: (Optional[str], None) for key in keys}
+    return create_model("OutputModelStructure", **output_structure)
+
+def request_options(timeout: float | None) -> dict:
+    """
+    Per-request options of the client. timeout=None means "no timeout" to the client, so it's only
+    passed when set.
+    """
+    return {"timeout": timeout} if timeout is not None else dict()
+
+def is_missing_file_error(error: Exception, file_id: str) -> bool:
+    """
+    Whether a failed request means the referenced file no longer exists (not found, or rejected as an
+    invalid file id).
+    """
+    from openai import BadRequestError, NotFoundError
+
+    return isinstance(error, NotFoundError) or (isinstance(error, BadRequestError) and file_id in str(error))
+
+def is_fatal_error(error: Exception) -> bool:
+    """
+    Whether a failed request means no other request can succeed either (invalid API key, missing
+    permission, client misconfigured), so retrying document after document is pointless.
+    """
+    from openai import AuthenticationError, OpenAIError, PermissionDeniedError
+
+    # A bare OpenAIError comes from the client itself (e.g. missing API key), not from a request
+    return isinstance(error, (AuthenticationError, PermissionDeniedError)) or type(error) is OpenAIError
+
+def is_connection_error(error: Exception) -> bool:
+    """
+    Whether a request failed to reach the API (timeouts excluded: they are about a slow request).
+    """
+    from openai import APIConnectionError, APITimeoutError
+
+    return isinstance(error, APIConnectionError) and not isinstance(error, APITimeoutError)
+
 class LLMExtractor:
-    def __init__(self):
-        self.__client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    def __init__(self, file_backend=None, file_handles_path: str | Path | None = Path(".cache") / "file_handles.json"):
+        """
+        file_backend receives the uploads of native PDFs (OpenAI files endpoint if None; any object with
+        an upload(filename, data) -> file_id method). file_handles_path persists the uploaded file ids
+        across runs (None keeps them in memory only).
+        """
+        self.__client = None # Created on first use, see __get_client()
+        self.__client_lock = threading.Lock()
+        self.__file_handles = FileHandleCache(
+            file_backend if file_backend is not None else OpenAIFilesBackend(self.__get_client),
+            index_path=file_handles_path,
+        )
+
+    def __get_client(self):
+        """
+        Return the OpenAI client, creating it on the first call.
+        Importing openai and building the client are deferred so that CLI startup and
+        runs fully answered by the heuristic don't pay for them.
+        """
+        with self.__client_lock: # Extractions may run in worker threads (two-phase mode)
+            if self.__client is None:
+                from openai import OpenAI
+
+                self.__client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        return self.__client
 
     def inference_cost_estimation(self, input_tokens: int, output_tokens: int) -> float:
         input_cost = (input_tokens / 1_000_000) * PRICE_PER_1M_INPUT_TOKENS
@@ -76,27 +143,50 @@ class LLMExtractor:
         total_cost = input_cost + output_cost
         return total_cost
 
-    def extract_from_text_representation(self, input_schema: dict, label: str, matrix: list, heuristic: Heuristic):
+    def usage_metadata(self, *responses) -> dict:
+        """
+        Summarize token usage and estimated cost of the responses of a document for the results metadata.
+        None responses (no LLM call was needed) are reported as zero usage.
+        """
+        input_tokens = output_tokens = total_tokens = cached_tokens = reasoning_tokens = 0
+        for response in responses:
+            if response is None:
+                continue
+            usage = response.usage
+            input_tokens += usage.input_tokens
+            output_tokens += usage.output_tokens
+            total_tokens += usage.total_tokens
+            cached_tokens += usage.input_tokens_details.cached_tokens
+            reasoning_tokens += usage.output_tokens_details.reasoning_tokens
+
+        return {
+            "total_tokens": total_tokens,
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "cached_tokens": cached_tokens,
+            "reasoning_tokens": reasoning_tokens,
+            "estimated_cost_usd": f"{self.inference_cost_estimation(input_tokens, output_tokens):3e}",
+        }
+
+    def extract_from_text_representation(self, input_schema: dict, label: str, matrix: list,
+                                         examples: dict[str, list[str]] | None = None, reasoning_effort: str = "minimal",
+                                         timeout: float | None = None):
         """
         Extract information by passing the text representation of the PDF (matrix form) to the model.
         Normally, it's cheaper and faster than passing the native PDF.
+        examples maps keys to example values (see Heuristic.get_examples_for_key), added to the request schema.
+        timeout is the request timeout in seconds (None = the client's default).
         """
+        examples = examples or dict()
         processed_schema = dict()
         for key, value in input_schema.items():
             processed_schema[key] = {"descricao": value}
-            examples = heuristic.get_examples_for_key(key, label)
-            if examples:
-                processed_schema[key]["examples"] = examples
-
-        mat_to_str = [f"Row {i+1}: " + " | ".join(row) for i, row in enumerate(matrix)]
-        mat_to_str = "\n".join(mat_to_str)
+            if examples.get(key):
+                processed_schema[key]["examples"] = examples[key]
 
-        os.makedirs("debug_outputs", exist_ok=True)
-        with open(Path("debug_outputs") / "pdf_representation.txt", "a", encoding="utf-8") as f:
-            f.write(mat_to_str + "\n\n" + ("="*80) + "\n\n")
+        mat_to_str = render_matrix(matrix)
 
-        output_structure = {key: (Optional[str], None) for key in input_schema.keys()}
-        OutputModelStructure = create_model("OutputModelStructure", **output_structure)
+        OutputModelStructure = build_output_model(input_schema.keys())
 
         yaml_schema = yaml.dump(processed_schema, allow_unicode=True)
 
@@ -104,39 +194,59 @@ class LLMExtractor:
 
         # logger.debug(f"Prompt: {prompt}")
 
-        response = self.__client.responses.parse(model="gpt-5-mini-2025-08-07",
+        response = self.__get_client().responses.parse(model="gpt-5-mini-2025-08-07",
                                                 text_format=OutputModelStructure,
-                                                reasoning={"effort":"minimal"},
-                                                input=prompt)
+                                                reasoning={"effort": reasoning_effort},
+                                                input=prompt,
+                                                **request_options(timeout))
         return response
         
-    def extract_from_native_pdf_file(self, input_schema: dict, pdf_path: str):
+    def extract_from_native_pdf_file(self, input_schema: dict, pdf_path: str, content_hash: str | None = None,
+                                     pages: list[int] | None = None, reasoning_effort: str = "minimal",
+                                     timeout: float | None = None):
         """
         Extract information by passing the native PDF file to the model.
         This method may be more accurate but is generally more expensive and slower.
+        The file is uploaded once and referenced by id on later calls (see utils.file_handles). If pages
+        is given (0-based), only those pages are sent, which reduces request size and image tokens.
+        timeout is the request timeout in seconds (None = the client's default).
         """
+        if content_hash is None:
+            content_hash = file_content_hash(pdf_path)
 
-        with open(pdf_path, "rb") as f:
-            pdf_bytes = f.read()
-        pdf_base64 = base64.b64encode(pdf_bytes).decode()
-
-        output_structure = {key: (Optional[str], None) for key in input_schema.keys()}
-        OutputModelStructure = create_model("OutputModelStructure", **output_structure)
+        OutputModelStructure = build_output_model(input_schema.keys())
 
         yaml_schema = yaml.dump(input_schema, allow_unicode=True)
 
         prompt = NATIVE_PDF_EXTRACTION_PROMPT.format(request_yaml=yaml_schema).strip()
 
-        response = self.__client.responses.parse(model="gpt-5-mini-2025-08-07",
+        file_id, uploaded = self.__file_handles.get_or_upload(content_hash, pdf_path, pages)
+        try:
+            return self.__parse_with_file(prompt, OutputModelStructure, file_id, reasoning_effort, timeout)
+        except Exception as e:
+            # Only a missing file (expired or deleted remotely) is solved by uploading again; rate limits,
+            # timeouts or validation errors are re-raised, so they don't cost an upload and a second request
+            if uploaded or not is_missing_file_error(e, file_id):
+                raise
+            logger.warning(f"Cached file {file_id} is no longer available ({e}). Uploading {pdf_path} again.")
+            # Concurrent calls (e.g. hedged requests) may fail on the same handle: invalidate() only drops it
+            # if it still maps to file_id, so only the first of them uploads again
+            self.__file_handles.invalidate(file_id)
+            file_id, _ = self.__file_handles.get_or_upload(content_hash, pdf_path, pages)
+            return self.__parse_with_file(prompt, OutputModelStructure, file_id, reasoning_effort, timeout)
+
+    def __parse_with_file(self, prompt: str, OutputModelStructure, file_id: str, reasoning_effort: str, timeout: float | None):
+        response = self.__get_client().responses.parse(model="gpt-5-mini-2025-08-07",
                                                 text_format=OutputModelStructure,
-                                                reasoning={"effort":"minimal"},
+                                                reasoning={"effort": reasoning_effort},
                                                 input=[
                                                     {
                                                         "role": "user",
                                                         "content": [
                                                                 {"type": "input_text", "text": prompt},
-                                                                {"type": "input_file", "filename": str(pdf_path), "file_data": f"data:application/pdf;base64,{pdf_base64}"}
+                                                                {"type": "input_file", "file_id": file_id}
                                                         ]
                                                     }
-                                                ])
-        return response
\ No newline at end of file
+                                                ],
+                                                **request_options(timeout))
+        return response
@@ -0,0 +1,259 @@
+"""
+Streamlit interface: runs the processing pipeline and shows statistics of the latest results.
+Imported only when the program is executed with --streamlit, so the CLI never loads
+streamlit, pandas or plotly.
+"""
+
+from utils.pipeline import run_processing, results_store, INPUT_DIR
+from utils.results_store import run_date
+
+import streamlit as st
+import pandas as pd
+import plotly.express as px
+from pathlib import Path
+import os
+from glob import glob
+
+def streamlit_run():
+    curr_dir = Path(__file__).parent.parent.resolve()
+
+    st.title("Extrator de PDFs")
+    st.write(f"Para o correto funcionamento, certifique-se de que os arquivos PDF referenciados pelo JSON de entrada estejam na pasta `{curr_dir / INPUT_DIR}`.")
+
+    default_path = os.path.join(curr_dir, "*.json")
+    existing_files = glob(default_path)
+
+    st.header("📥 Selecionar Arquivo de Entrada")   
+
+    st.write(f"Apenas arquivos em `{curr_dir}` serão considerados.")
+    input_json_path = st.selectbox("Escolha um arquivo:", existing_files,
+                                accept_new_options=False,
+                                index=None,
+                                placeholder="Selecione um arquivo...")
+
+    if input_json_path is None or not os.path.isfile(input_json_path):
+        st.info("Por favor, selecione um arquivo JSON válido para continuar.")
+    else:
+        st.success(f"✅ Arquivo carregado: {os.path.basename(input_json_path)}")
+
+        if st.button("Run"):
+            progress = st.progress(0)
+            status_text = st.empty()
+
+            try:
+                for processed, total in run_processing(input_json_path):
+                    if total is None: # Manifest too large to be counted beforehand
+                        status_text.write(f"Processando {processed} PDFs...")
+                        continue
+                    percent = int((processed / total) * 100)
+                    progress.progress(percent)
+                    status_text.write(f"Processando {processed}/{total} PDFs...")   
+            except Exception as e:
+                st.error(f"Ocorreu um erro durante o processamento. \n\n Erro: {e}")
+
+            status_text.write("✅ Processamento concluído!")
+            progress.progress(100)
+    
+    if st.button("Show stats"):
+        st.session_state["show_stats"] = True # Keep the view open while filters change
+
+    if st.session_state.get("show_stats"):
+        show_stats()
+
+@st.cache_data(show_spinner=False)
+def load_run(run_id: str) -> pd.DataFrame:
+    """
+    Load a single run from the results store. Cached per run, so only new runs are read on reruns.
+    """
+    return results_store.load(runs=[run_id])
+
+def sync_results_files():
+    """
+    Backfill the results store with results_*.json files of runs not stored yet.
+    """
+    for results_json in glob("results_*.json"):
+        try:
+            results_store.import_results_file(results_json)
+        except Exception as e:
+            st.warning(f"Não foi possível importar `{results_json}`: {e}")
+
+def show_stats():
+    sync_results_files()
+    runs = results_store.list_runs()
+    if len(runs) == 0:
+        st.error("Nenhum resultado encontrado. Execute o processamento primeiro.")
+        return
+
+    # ======= Filters
+    st.sidebar.header("🔎 Filtros")
+    selected_runs = st.sidebar.multiselect("Execuções", runs, default=runs[:1])
+    run_dates = [d for d in (run_date(r) for r in runs) if d is not None]
+    date_range = None
+    if run_dates:
+        date_range = st.sidebar.date_input("Período", value=(min(run_dates).date(), max(run_dates).date()))
+
+    if len(selected_runs) == 0:
+        st.info("Selecione ao menos uma execução.")
+        return
+
+    frames = [frame for frame in (load_run(run_id) for run_id in selected_runs) if not frame.empty]
+    if len(frames) == 0:
+        st.error("Nenhum dado armazenado para as execuções selecionadas.")
+        return
+    df = pd.concat(frames, ignore_index=True)
+
+    if isinstance(date_range, tuple) and len(date_range) == 2:
+        start, end = date_range
+        df = df[df["run_date"].isna() | df["run_date"].dt.date.between(start, end)]
+
+    labels = sorted(df["label"].unique())
+    selected_labels = st.sidebar.multiselect("Labels", labels, default=labels)
+    df = df[df["label"].isin(selected_labels)]
+    if df.empty:
+        st.error("Nenhum dado para os filtros selecionados.")
+        return
+
+    st.write(f"Execuções carregadas: {', '.join(f'`{r}`' for r in selected_runs)}")
+
+
+    # ======= Overall statistics
+    st.header("✅ Estatísticas Gerais da Extração")
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("PDFs Processados", len(df))
+    col2.metric("Custo Total (USD)", f"${df['estimated_cost_usd'].sum():.8f}")
+    col3.metric("Número Total de Chaves Extraídas", df["num_keys_extracted"].sum())
+
+    col4, col5, col6 = st.columns(3)
+    col4.metric("Aproveitamento Heurística (%)", f"{df['heuristic_hits_percent'].mean():.2f}%")
+    col5.metric("Latência Média (s)", f"{df['latency_seconds'].mean():.2f}")
+    col6.metric("Média de Tokens Totais", f"{df['total_tokens'].mean():.2f}")
+
+    # ======= Relationships between variables
+    st.header("📊 Análises Gerais")
+    st.dataframe(df)
+
+    tab1, tab2, tab3, tab4, tab5 = st.tabs(["Tokens x Latência", "Performance Heurística x Latência", "Performance Heurística x Tokens", "Versão Prompt x Tokens", "Versão Prompt x Latência"])
+
+    with tab1:
+        fig = px.scatter(
+            df,
+            x="total_tokens",
+            y="latency_seconds",
+            color="label",
+            hover_data=["label", "pdf_path", "num_keys_extracted", "estimated_cost_usd", "heuristic_hits_percent"],
+            title="Relação entre Tokens e Latência (por PDF)",
+        )
+        st.plotly_chart(fig)
+    with tab2:
+        fig = px.scatter(
+            df,
+            x="heuristic_hits_percent",
+            y="latency_seconds",
+            color="label",
+            hover_data=["label", "pdf_path", "num_keys_extracted", "estimated_cost_usd", "total_tokens"],
+            title="Relação entre Performance da Heurística e Latência (por PDF)",
+        )
+        st.plotly_chart(fig)
+    with tab3:
+        fig = px.scatter(
+            df,
+            x="heuristic_hits_percent",
+            y="total_tokens",
+            color="label",
+            hover_data=["label", "pdf_path", "num_keys_extracted", "estimated_cost_usd", "latency_seconds"],
+            title="Relação entre Performance da Heurística e Tokens (por PDF)",
+        )
+        st.plotly_chart(fig)
+    with tab4:
+        fig = px.box(
+            df,
+            x="version_used",
+            y="total_tokens",
+            points="all",
+            title="Distribuição de Tokens por Versão de Prompt Usada (ver README)",
+        )
+        st.plotly_chart(fig)
+    with tab5:
+        fig = px.box(
+            df,
+            x="version_used",
+            y="latency_seconds",
+            points="all",
+            title="Distribuição de Latência por Versão de Prompt Usada (ver README)",
+        )
+        st.plotly_chart(fig)
+
+
+    # ======= Statistics by label
+    st.header("📌 Estatísticas por Label")
+
+    df_labels = (
+        df.groupby("label")
+        .agg(
+            num_pdfs=("label", "count"),
+            avg_num_keys_extracted=("num_keys_extracted", "mean"),
+            total_estimated_cost_usd=("estimated_cost_usd", "sum"),
+            avg_heuristic_hits_percent=("heuristic_hits_percent", "mean"),
+            avg_latency_seconds=("latency_seconds", "mean"),
+            avg_total_tokens=("total_tokens", "mean"),
+        )
+        .reset_index()
+    )
+
+    st.dataframe(df_labels)
+
+    st.subheader("📈 Visualizações Interativas")
+
+    tab1, tab2, tab3, tab4 = st.tabs(["Custo Total", "Latência", "Tokens Totais", "Performance Heurística"])
+
+    with tab1:
+        fig = px.bar(df_labels, x="label", y="total_estimated_cost_usd", title="Custo Total por Label")
+        st.plotly_chart(fig)
+
+    with tab2:
+        fig = px.box(df, x="label", y="latency_seconds", points="all",
+                    title="Distribuição de Latência por Label")
+        st.plotly_chart(fig)
+
+    with tab3:
+        fig = px.box(df, x="label", y="total_tokens", points="all",
+                        title="Distribuição de Tokens")
+        st.plotly_chart(fig)
+    with tab4:
+        fig = px.bar(df_labels, x="label", y="avg_heuristic_hits_percent", title="Performance Média da Heurística por Label")
+        st.plotly_chart(fig)
+
+    # ======= Trends across runs
+    st.header("📈 Tendências entre Execuções")
+
+    df_runs = (
+        df.groupby(["run_id", "label"])
+        .agg(
+            run_date=("run_date", "first"),
+            avg_latency_seconds=("latency_seconds", "mean"),
+            avg_total_tokens=("total_tokens", "mean"),
+            avg_heuristic_hits_percent=("heuristic_hits_percent", "mean"),
+        )
+        .reset_index()
+        .sort_values("run_id")
+    )
+
+    if df_runs["run_id"].nunique() < 2:
+        st.info("Selecione ao menos duas execuções para visualizar tendências.")
+        return
+
+    tab1, tab2, tab3 = st.tabs(["Latência", "Tokens Totais", "Performance Heurística"])
+
+    with tab1:
+        fig = px.line(df_runs, x="run_id", y="avg_latency_seconds", color="label", markers=True,
+                      title="Latência Média por Execução")
+        st.plotly_chart(fig)
+    with tab2:
+        fig = px.line(df_runs, x="run_id", y="avg_total_tokens", color="label", markers=True,
+                      title="Média de Tokens Totais por Execução")
+        st.plotly_chart(fig)
+    with tab3:
+        fig = px.line(df_runs, x="run_id", y="avg_heuristic_hits_percent", color="label", markers=True,
+                      title="Aproveitamento Médio da Heurística por Execução")
+        st.plotly_chart(fig)
@@ -0,0 +1,115 @@
+"""
+Bounded, asynchronous sink for debug outputs (the matrix representation of each document).
+Documents are sampled (every Nth one and/or only failures), written by a background thread to one
+file per document id and the directory is rotated by size, so debug mode stays cheap on the hot path.
+"""
+
+from collections import deque
+from pathlib import Path
+from queue import Queue, Full
+import logging
+import os
+import threading
+
+from utils.pdf2mat import render_matrix
+
+logger = logging.getLogger("my_logger")
+
+class DebugSink:
+    def __init__(self, root: str | Path = Path("debug_outputs") / "representations", sample_every: int = 1,
+                 only_failures: bool = False, max_bytes: int = 50 * (1 << 20), queue_size: int = 256):
+        """
+        sample_every: write one of every N documents (0 disables the sink). Failed documents (see submit)
+        are always written.
+        only_failures: write only failed documents.
+        max_bytes: when the files in root exceed this size, the oldest ones are deleted.
+        queue_size: pending writes; when full, new outputs are dropped instead of blocking.
+        """
+        self.__root = Path(root)
+        self.__sample_every = sample_every
+        self.__only_failures = only_failures
+        self.__max_bytes = max_bytes
+        self.__queue: Queue = Queue(maxsize=queue_size)
+        self.__files: deque = deque() # (path, size), oldest first
+        self.__total_bytes = 0
+        self.__seen = 0
+        self.dropped = 0
+        self.__thread = None
+
+    @classmethod
+    def from_env(cls) -> "DebugSink":
+        """
+        Build the sink from DEBUG_SAMPLE_EVERY, DEBUG_ONLY_FAILURES and DEBUG_MAX_MB.
+        """
+        return cls(
+            sample_every=int(os.getenv("DEBUG_SAMPLE_EVERY", "1")),
+            only_failures=os.getenv("DEBUG_ONLY_FAILURES", "0") == "1",
+            max_bytes=int(float(os.getenv("DEBUG_MAX_MB", "50")) * (1 << 20)),
+        )
+
+    def submit(self, doc_id: str, matrix: list[list[str]] | None, failed: bool) -> str | None:
+        """
+        Queue the debug output of a document if it is sampled. A document is failed when its matrix
+        couldn't be built or the LLM call failed. Returns the path the output will be written to, or None
+        if it was not sampled (or dropped). The file may be deleted later by the size rotation.
+        """
+        self.__seen += 1
+        if self.__sample_every <= 0:
+            return None
+        if self.__only_failures and not failed:
+            return None
+        if not failed and (self.__seen - 1) % self.__sample_every != 0:
+            return None
+
+        self.__start()
+        path = self.__root / f"{doc_id}.txt"
+        try:
+            self.__queue.put_nowait((path, matrix))
+        except Full:
+            self.dropped += 1
+            return None
+        return str(path)
+
+    def flush(self) -> None:
+        """
+        Wait until the queued outputs are written.
+        """
+        if self.__thread is not None:
+            self.__queue.join()
+
+    def __start(self) -> None:
+        if self.__thread is not None:
+            return
+        os.makedirs(self.__root, exist_ok=True)
+        # Existing files count towards the size budget, so rotation holds across runs
+        existing = sorted((p for p in self.__root.iterdir() if p.is_file()), key=lambda p: p.stat().st_mtime)
+        for path in existing:
+            size = path.stat().st_size
+            self.__files.append((path, size))
+            self.__total_bytes += size
+        self.__thread = threading.Thread(target=self.__writer, name="debug-sink", daemon=True)
+        self.__thread.start()
+
+    def __writer(self) -> None:
+        while True:
+            path, matrix = self.__queue.get()
+            try:
+                content = render_matrix(matrix) if matrix is not None else "Matrix representation unavailable."
+                data = content.encode("utf-8")
+                path.write_bytes(data)
+                self.__files.append((path, len(data)))
+                self.__total_bytes += len(data)
+                self.__rotate()
+            except OSError as e:
+                logger.warning(f"Couldn't write debug output {path}: {e}")
+            finally:
+                self.__queue.task_done()
+
+    def __rotate(self) -> None:
+        while self.__total_bytes > self.__max_bytes and len(self.__files) > 1:
+            path, size = self.__files.popleft()
+            self.__total_bytes -= size
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
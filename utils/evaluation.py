@@ -0,0 +1,152 @@
+"""
+Scoring of extraction results against reference targets (e.g. target/dataset_targets.json).
+Values are compared after the same normalization PDF2Matrix applies to the PDF text.
+"""
+
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+from utils.input_stream import iter_input_items
+from utils.pdf2mat import normalize_text
+
+def normalize_value(value: Optional[str]) -> str:
+    """
+    Normalize an extracted/expected value for comparison. Missing values (None, "") compare as "".
+    """
+    return normalize_text(value) if value else ""
+
+def load_targets(targets_json_path: str | Path) -> Dict[tuple, Dict[str, Optional[str]]]:
+    """
+    Load the targets file into a {(label, pdf_path): expected_output} map.
+    """
+    return {(t["label"], t["pdf_path"]): t["output"] for t in iter_input_items(targets_json_path)}
+
+def key_matches(predicted: Dict[str, Optional[str]], expected: Dict[str, Optional[str]], keys: Iterable[str]) -> Dict[str, bool]:
+    """
+    Return, for each key, whether the predicted value matches the expected one.
+    """
+    return {key: normalize_value(predicted.get(key)) == normalize_value(expected.get(key)) for key in keys}
+
+def field_accuracy(predicted: Dict[str, Optional[str]], expected: Dict[str, Optional[str]], keys: Iterable[str]) -> Optional[float]:
+    """
+    Fraction of keys whose predicted value matches the expected one. None if there are no keys.
+    """
+    matches = key_matches(predicted, expected, keys)
+    if not matches:
+        return None
+    return sum(matches.values()) / len(matches)
+
+def percentile(values: list[float], q: float) -> Optional[float]:
+    """
+    q-th percentile (0-100) with linear interpolation. None for an empty list.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+class _Accumulator:
+    """
+    Running totals of one group of records (a configuration, a label or a key).
+    """
+    def __init__(self):
+        self.documents = 0
+        self.failed = 0 # Documents whose LLM call failed (their LLM keys are null, not absent)
+        self.matches = 0
+        self.scored_keys = 0
+        self.latencies = list()
+        self.tokens = 0
+        self.cost = 0.0
+
+    def add_record(self, metadata: dict) -> None:
+        self.documents += 1
+        self.failed += int(bool(metadata.get("llm_failed")))
+        self.latencies.append(metadata.get("latency_seconds", 0.0))
+        self.tokens += metadata.get("total_tokens", 0)
+        self.cost += float(metadata.get("estimated_cost_usd", 0) or 0)
+
+    def add_matches(self, matches: Dict[str, bool]) -> None:
+        self.matches += sum(matches.values())
+        self.scored_keys += len(matches)
+
+    def accuracy(self) -> Optional[float]:
+        return self.matches / self.scored_keys if self.scored_keys else None
+
+    def summary(self) -> dict:
+        return {
+            "documents": self.documents,
+            "failed_documents": self.failed,
+            "scored_keys": self.scored_keys,
+            "accuracy": self.accuracy(),
+            "mean_latency_seconds": sum(self.latencies) / len(self.latencies) if self.latencies else None,
+            "p95_latency_seconds": percentile(self.latencies, 95),
+            "mean_total_tokens": self.tokens / self.documents if self.documents else None,
+            "mean_cost_usd": self.cost / self.documents if self.documents else None,
+            "total_cost_usd": self.cost,
+        }
+
+def configuration_name(results_json_path: str | Path, metadata: dict, group_by: str) -> str:
+    """
+    Name of the configuration a record belongs to: its results file ("run") or its route ("route").
+    """
+    if group_by == "route":
+        return f"{metadata.get('version_used')}:{metadata.get('reasoning_effort') or 'minimal'}"
+    return Path(results_json_path).name
+
+def evaluate_results(results_json_paths: Iterable[str | Path], targets: Dict[tuple, Dict[str, Optional[str]]],
+                     group_by: str = "run") -> dict:
+    """
+    Score the results files against the targets. Works only on the stored records, so it runs fully
+    offline. Returns {"configurations": {name: {"summary", "labels", "keys"}}, "pareto": [names]}.
+    """
+    configurations: Dict[str, dict] = dict()
+    for results_json_path in results_json_paths:
+        for record in iter_input_items(results_json_path):
+            metadata = record["metadata"]
+            name = configuration_name(results_json_path, metadata, group_by)
+            config = configurations.setdefault(name, {"summary": _Accumulator(), "labels": dict(), "keys": dict()})
+            label_acc = config["labels"].setdefault(metadata["label"], _Accumulator())
+
+            config["summary"].add_record(metadata)
+            label_acc.add_record(metadata)
+
+            expected = targets.get((metadata["label"], metadata["pdf_path"]))
+            if expected is None: # Document without reference: counted for cost/latency only
+                continue
+
+            matches = key_matches(record["extraction_schema"], expected, expected.keys())
+            config["summary"].add_matches(matches)
+            label_acc.add_matches(matches)
+            for key, matched in matches.items():
+                config["keys"].setdefault(f"{metadata['label']}.{key}", _Accumulator()).add_matches({key: matched})
+
+    report = {
+        name: {
+            "summary": config["summary"].summary(),
+            "labels": {label: acc.summary() for label, acc in sorted(config["labels"].items())},
+            "keys": {key: acc.accuracy() for key, acc in sorted(config["keys"].items())},
+        }
+        for name, config in configurations.items()
+    }
+    return {"configurations": report, "pareto": pareto_front({name: c["summary"] for name, c in report.items()})}
+
+def pareto_front(summaries: Dict[str, dict]) -> list[str]:
+    """
+    Return the configurations not dominated on (accuracy up, mean cost down, mean latency down).
+    Configurations without scored keys are left out.
+    """
+    points = {
+        name: (s["accuracy"], s["mean_cost_usd"], s["mean_latency_seconds"])
+        for name, s in summaries.items() if s["accuracy"] is not None
+    }
+
+    def dominates(a: tuple, b: tuple) -> bool:
+        no_worse = a[0] >= b[0] and a[1] <= b[1] and a[2] <= b[2]
+        better = a[0] > b[0] or a[1] < b[1] or a[2] < b[2]
+        return no_worse and better
+
+    front = [name for name, point in points.items() if not any(dominates(other, point) for other in points.values() if other is not point)]
+    return sorted(front, key=lambda name: points[name][1])
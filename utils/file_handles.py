@@ -0,0 +1,141 @@
+"""
+Upload-once handling of the PDFs sent to the model.
+Instead of inlining the PDF as base64 in every request (~33% more bytes, re-sent on retries and
+repeated runs), each file is uploaded once and referenced by its file id afterwards. Handles are
+keyed by content hash (plus the selected pages, when the PDF is trimmed) and persisted on disk, so
+they are reused across runs (and shared by concurrent runs: the index is merged on save, under a lock).
+"""
+
+from pathlib import Path
+from io import BytesIO
+import hashlib
+import json
+import logging
+import os
+import threading
+
+from utils.file_lock import file_lock
+
+logger = logging.getLogger("my_logger")
+
+class OpenAIFilesBackend:
+    """
+    Files endpoint of the OpenAI API.
+    """
+    def __init__(self, get_client):
+        self.__get_client = get_client # Callable returning the (lazily created) OpenAI client
+
+    def upload(self, filename: str, data: bytes) -> str:
+        file_object = self.__get_client().files.create(file=(filename, data, "application/pdf"), purpose="user_data")
+        return file_object.id
+
+class LocalFilesBackend:
+    """
+    Local stand-in for the files endpoint: stores uploads in a directory and returns deterministic ids.
+    Useful to exercise the upload/reuse logic offline.
+    """
+    def __init__(self, root: str | Path):
+        self.__root = Path(root)
+        self.__root.mkdir(parents=True, exist_ok=True)
+        self.upload_count = 0
+
+    def upload(self, filename: str, data: bytes) -> str:
+        file_id = f"file-local-{hashlib.sha256(data).hexdigest()[:24]}"
+        (self.__root / f"{file_id}.pdf").write_bytes(data)
+        self.upload_count += 1
+        return file_id
+
+    def read(self, file_id: str) -> bytes:
+        return (self.__root / f"{file_id}.pdf").read_bytes()
+
+def trim_pdf(pdf_path: str | Path, pages: list[int]) -> bytes:
+    """
+    Return a PDF containing only the given pages (0-based) of pdf_path. Out of range pages are ignored.
+    """
+    from pypdf import PdfReader, PdfWriter
+
+    reader = PdfReader(pdf_path)
+    writer = PdfWriter()
+    for page in sorted(set(pages)):
+        if 0 <= page < len(reader.pages):
+            writer.add_page(reader.pages[page])
+
+    buffer = BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+class FileHandleCache:
+    def __init__(self, backend, index_path: str | Path | None = Path(".cache") / "file_handles.json"):
+        """
+        backend must implement upload(filename, data) -> file_id.
+        index_path persists the content-hash -> file_id map across runs (None keeps it in memory only).
+        """
+        self.__backend = backend
+        self.__index_path = Path(index_path) if index_path is not None else None
+        self.__lock = threading.Lock()
+        self.__handles: dict[str, str] = self.__load()
+        self.__added: set[str] = set() # Cache keys uploaded by this process since the last save
+        self.__invalidated: set[str] = set() # File ids dropped by this process since the last save
+
+    def get_or_upload(self, content_hash: str, pdf_path: str | Path, pages: list[int] | None = None) -> tuple[str, bool]:
+        """
+        Return (file_id, uploaded) for the PDF, uploading it (trimmed to pages, if given) only when
+        no handle exists for the same content and pages.
+        """
+        cache_key = content_hash if pages is None else f"{content_hash}:{','.join(map(str, sorted(set(pages))))}"
+        with self.__lock:
+            file_id = self.__handles.get(cache_key)
+            if file_id is not None:
+                return file_id, False
+
+            if pages is None:
+                data = Path(pdf_path).read_bytes()
+            else:
+                data = trim_pdf(pdf_path, pages)
+            file_id = self.__backend.upload(Path(pdf_path).name, data)
+            logger.debug(f"Uploaded {pdf_path} ({len(data)} bytes, pages={pages}) as {file_id}")
+
+            self.__handles[cache_key] = file_id
+            self.__added.add(cache_key)
+            self.__save()
+            return file_id, True
+
+    def invalidate(self, file_id: str) -> None:
+        """
+        Forget a handle (e.g. the file expired or was deleted remotely), forcing a new upload on next use.
+        """
+        with self.__lock:
+            self.__handles = {k: v for k, v in self.__handles.items() if v != file_id}
+            self.__added = {k for k in self.__added if k in self.__handles}
+            self.__invalidated.add(file_id)
+            self.__save()
+
+    def __load(self) -> dict[str, str]:
+        if self.__index_path is None or not self.__index_path.is_file():
+            return dict()
+        try:
+            with open(self.__index_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            logger.warning(f"Couldn't load file handles from {self.__index_path}: {e}")
+            return dict()
+
+    def __save(self) -> None:
+        """
+        Write this process's changes into the index as it is on disk (other runs may have saved theirs
+        since it was read) and adopt the result, so uploads of other runs are reused too.
+        """
+        if self.__index_path is None:
+            return
+        with file_lock(self.__index_path):
+            handles = {k: v for k, v in self.__load().items() if v not in self.__invalidated}
+            handles.update({k: self.__handles[k] for k in self.__added})
+
+            tmp_path = self.__index_path.with_suffix(".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(handles, f, indent=4)
+            os.replace(tmp_path, self.__index_path)
+
+        self.__handles = handles
+        self.__added.clear()
+        self.__invalidated.clear()
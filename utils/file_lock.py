@@ -0,0 +1,36 @@
+"""
+Inter-process lock for the files shared by concurrent runs (the .cache indexes), so that the
+read-merge-write update of one process doesn't overwrite the updates of another.
+"""
+
+from contextlib import contextmanager
+from pathlib import Path
+import os
+
+@contextmanager
+def file_lock(path: str | Path):
+    """
+    Hold an exclusive lock on path for the duration of the block. The lock is taken on a side
+    "<path>.lock" file, so path itself can be replaced atomically while it is held.
+    """
+    lock_path = Path(f"{path}.lock")
+    os.makedirs(lock_path.parent, exist_ok=True)
+    with open(lock_path, "a+b") as f:
+        if os.name == "nt":
+            import msvcrt
+
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1) # Retries for ~10 s, then raises OSError
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
@@ -0,0 +1,172 @@
+"""
+Hedged requests to cut the latency tail of LLM calls.
+Latencies are tracked per (label, extraction mode). When a call takes longer than a percentile of the
+recent latencies for its key, a duplicate request is fired and the first answer wins. A hedge budget
+(share of requests hedged and, optionally, extra USD spent) caps the additional cost.
+
+The losing request isn't cancelled (the API has no way to), so requests get a timeout proportional to
+the deadline, and a request never waits behind losers for a worker: when the pool is busy, hedging is
+skipped and the request runs in the caller's thread.
+"""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass
+from time import time
+from typing import Callable, Dict, Optional
+import logging
+import os
+import threading
+
+from utils.evaluation import percentile
+
+logger = logging.getLogger("my_logger")
+
+@dataclass
+class HedgeInfo:
+    fired: bool = False # A duplicate request was sent
+    won: bool = False # The duplicate answered first
+    extra_cost_usd: float = 0.0 # Estimated cost of the duplicate request
+
+class LatencyTracker:
+    def __init__(self, window: int = 200):
+        self.__window = window
+        self.__latencies: Dict[tuple, deque] = dict()
+        self.__lock = threading.Lock()
+
+    def observe(self, key: tuple, latency_seconds: float) -> None:
+        with self.__lock:
+            self.__latencies.setdefault(key, deque(maxlen=self.__window)).append(latency_seconds)
+
+    def deadline(self, key: tuple, q: float, min_samples: int) -> Optional[float]:
+        """
+        q-th percentile of the recent latencies of key, or None while there are fewer than min_samples.
+        """
+        with self.__lock:
+            latencies = list(self.__latencies.get(key, ()))
+        if len(latencies) < min_samples:
+            return None
+        return percentile(latencies, q)
+
+class Hedger:
+    def __init__(self, percentile_deadline: float = 95, min_samples: int = 20, max_hedge_ratio: float = 0.05,
+                 max_extra_cost_usd: Optional[float] = None, max_workers: int = 16, timeout_factor: float = 4.0):
+        """
+        percentile_deadline: latency percentile (per label and mode) after which a duplicate is fired.
+        min_samples: latencies needed for a key before hedging it.
+        max_hedge_ratio: maximum share of requests that may be hedged.
+        max_extra_cost_usd: maximum estimated USD spent on duplicates (None = unbounded).
+        max_workers: threads running the requests (primaries and duplicates).
+        timeout_factor: per-request timeout, as a multiple of the deadline of the key (bounds how long a
+        losing request holds its thread).
+        """
+        self.__percentile = percentile_deadline
+        self.__min_samples = min_samples
+        self.__max_hedge_ratio = max_hedge_ratio
+        self.__max_extra_cost = max_extra_cost_usd
+        self.__timeout_factor = timeout_factor
+        self.__tracker = LatencyTracker()
+        self.__max_workers = max_workers
+        self.__executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hedge")
+        self.__in_flight = 0 # Requests running in the pool, losers of earlier hedges included
+        self.__lock = threading.Lock()
+        self.requests = 0
+        self.hedges_fired = 0
+        self.hedges_won = 0
+        self.extra_cost_usd = 0.0
+
+    @classmethod
+    def from_env(cls) -> Optional["Hedger"]:
+        """
+        Build the hedger from LLM_HEDGING=1 and the LLM_HEDGE_* settings. Returns None if hedging is disabled.
+        """
+        if os.getenv("LLM_HEDGING", "0") != "1":
+            return None
+        max_extra_cost = os.getenv("LLM_HEDGE_MAX_EXTRA_COST_USD")
+        return cls(
+            percentile_deadline=float(os.getenv("LLM_HEDGE_PERCENTILE", "95")),
+            min_samples=int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20")),
+            max_hedge_ratio=float(os.getenv("LLM_HEDGE_MAX_RATIO", "0.05")),
+            max_extra_cost_usd=float(max_extra_cost) if max_extra_cost else None,
+            timeout_factor=float(os.getenv("LLM_HEDGE_TIMEOUT_FACTOR", "4")),
+        )
+
+    def run(self, key: tuple, call: Callable, cost_of: Callable[[object], float]) -> tuple:
+        """
+        Run call(timeout), hedging it if it exceeds the deadline of key. timeout is the per-request timeout
+        in seconds (None while the key has no deadline: the client's default applies). cost_of(result)
+        estimates the USD cost of a result. Returns (result, HedgeInfo).
+        """
+        with self.__lock:
+            self.requests += 1
+
+        info = HedgeInfo()
+        deadline = self.__tracker.deadline(key, self.__percentile, self.__min_samples)
+        timeout = deadline * self.__timeout_factor if deadline is not None else None
+        primary = self.__submit(key, call, timeout)
+        if primary is None: # Every worker is busy (e.g. with losers): don't wait for one, nor hedge
+            start_time = time()
+            result = call(timeout)
+            self.__tracker.observe(key, time() - start_time)
+            return result, info
+        if deadline is None:
+            return primary.result(), info
+
+        done, _ = wait([primary], timeout=deadline)
+        if done or not self.__take_budget():
+            return primary.result(), info
+
+        hedge = self.__submit(key, call, timeout)
+        if hedge is None:
+            with self.__lock: # Budget taken but nothing fired
+                self.hedges_fired -= 1
+            return primary.result(), info
+
+        logger.debug(f"Request for {key} exceeded {deadline:.2f}s, firing a hedge.")
+        info.fired = True
+
+        pending = {primary, hedge}
+        first_error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    first_error = first_error or future.exception()
+                    continue
+                result = future.result()
+                info.won = future is hedge
+                info.extra_cost_usd = cost_of(result) # The duplicate costs about the same as the answer
+                with self.__lock:
+                    self.hedges_won += int(info.won)
+                    self.extra_cost_usd += info.extra_cost_usd
+                return result, info
+        raise first_error
+
+    def __submit(self, key: tuple, call: Callable, timeout: Optional[float]):
+        """
+        Run call(timeout) in the pool. Returns None, without submitting, when no worker is free.
+        """
+        with self.__lock:
+            if self.__in_flight >= self.__max_workers:
+                return None
+            self.__in_flight += 1
+        start_time = time()
+
+        def on_done(future):
+            with self.__lock:
+                self.__in_flight -= 1
+            if future.exception() is None:
+                self.__tracker.observe(key, time() - start_time)
+
+        future = self.__executor.submit(call, timeout)
+        future.add_done_callback(on_done)
+        return future
+
+    def __take_budget(self) -> bool:
+        with self.__lock:
+            if (self.hedges_fired + 1) / self.requests > self.__max_hedge_ratio:
+                return False
+            if self.__max_extra_cost is not None and self.extra_cost_usd >= self.__max_extra_cost:
+                return False
+            self.hedges_fired += 1
+            return True
@@ -3,44 +3,46 @@ This module implements a heuristic caching mechanism to optimize data extraction
 It maintains a cache of heuristics based on previously extracted data to improve the accuracy and efficiency
 of future extractions. The heuristics are applied during preprocessing to fill in fields in the request schema
 based on cached data, and the cache is updated with new observations after each extraction.
+The cache itself lives in a storage backend (see utils.heuristic_store): in memory by default, or a
+shared SQLite database when several workers should learn from each other.
 """
-import random
-from copy import deepcopy
-from typing import Dict, List
+from typing import Dict, List, Tuple
 import logging
 
 from utils.type_resolution import TypeResolver
 from utils.pdf2mat import PDF2Matrix
+from utils.heuristic_store import InMemoryHeuristicStore
 
 # Logging setup
 logger = logging.getLogger("my_logger")
 
 class Heuristic:
-    def __init__(self, num_heuristics_per_key: int = 5, num_examples_per_key: int = 3):
+    def __init__(self, num_heuristics_per_key: int = 5, num_examples_per_key: int = 3, store=None):
         """
         Initialize the Heuristic object with a specified number of maximum heuristics to store per key.
+        store is the storage backend of the cache (InMemoryHeuristicStore if None).
         """
         if num_heuristics_per_key < 1:
             raise ValueError("num_heuristics_per_key must be >= 1")
         
         self.__num_heuristics_per_key = int(num_heuristics_per_key)
         self.__num_examples_per_key = int(num_examples_per_key)
-        self.__cache: Dict[str, Dict[str, Dict]] = dict()
+        self.__store = store if store is not None else InMemoryHeuristicStore()
         self.__type_resolver = TypeResolver()
 
     def get_cache(self) -> Dict[str, Dict[str, Dict]]:
         """
-        Return a deep copy of the current heuristic cache to avoid accidental mutation.
+        Return a copy of the current heuristic cache to avoid accidental mutation.
         """
-        return deepcopy(self.__cache)
+        return self.__store.dump()
 
     def get_examples_for_key(self, key: str, label: str, num_examples: int = 2) -> List[str]:
         """
         Retrieve up to num_examples example values for a given key under a specific label from the heuristic cache.
         """
         examples = []
-        if label in self.__cache and key in self.__cache[label]:
-            cached_key = self.__cache[label][key]
+        cached_key = self.__store.get_label(label).get(key)
+        if cached_key:
             values_set = cached_key.get("example_values", list())
             examples = list(values_set)[:num_examples]
         return examples
@@ -50,20 +52,39 @@ class Heuristic:
         label: str,
         request_schema: Dict[str, dict],
         pdf_matrix_representation: List[List[str]],
+        pdf_pages: List[List[List[str]]] | None = None,
     ) -> Dict[str, str]:
         """
         Apply heuristic preprocessing to fill in fields in the request schema based on cached heuristics.
+        pdf_pages is the per-page matrix (PDF2Matrix.get_pages()), needed by (page, row, col) positions;
+        legacy (row, col) and (row,) positions are looked up in pdf_matrix_representation.
         Return a partial_result dict with filled fields.
         """
+        partial_result, _ = self.heuristic_preprocessing_with_confidence(label, request_schema, pdf_matrix_representation, pdf_pages)
+        return partial_result
+
+    def heuristic_preprocessing_with_confidence(
+        self,
+        label: str,
+        request_schema: Dict[str, dict],
+        pdf_matrix_representation: List[List[str]],
+        pdf_pages: List[List[List[str]]] | None = None,
+    ) -> Tuple[Dict[str, str], Dict[str, float]]:
+        """
+        Same as heuristic_preprocessing, also returning the confidence of each filled key: the share of
+        the key's observations (count) in which the matching heuristic hit (match_count).
+        """
 
-        if label not in self.__cache: # No cached heuristics for this label
-            return dict()
+        cached_label = self.__store.get_label(label)
+        if not cached_label: # No cached heuristics for this label
+            return dict(), dict()
         
         partial_result = dict()
+        confidence = dict()
 
         for key in list(request_schema.keys()):
 
-            cached_key = self.__cache[label].get(key)
+            cached_key = cached_label.get(key)
             if not cached_key: # No cached heuristics for this key
                 continue
 
@@ -80,10 +101,18 @@ class Heuristic:
                     continue
 
                 try:
-                    # 2D position (row, col)
-                    if len(position) == 2:
+                    # Page-aware position (page, row, col), col None for an entire row
+                    if len(position) == 3:
+                        if pdf_pages is None:
+                            continue
+                        page_index, row_index, col_index = position
+                        row = pdf_pages[page_index][row_index]
+                        pdf_element = " ".join(row) if col_index is None else row[col_index]
+                    # Legacy 2D position (row, col) on the flattened matrix
+                    elif len(position) == 2:
                         row_index, col_index = position
                         pdf_element = pdf_matrix_representation[row_index][col_index]
+                    # Legacy entire row (row,) on the flattened matrix
                     elif len(position) == 1:
                         row_index = position[0]
                         pdf_element = " ".join(pdf_matrix_representation[row_index])
@@ -124,24 +153,16 @@ class Heuristic:
 
                 # Update partial_result and heuristic stats
                 partial_result[key] = pdf_element
-                record_heuristic["match_count"] = record_heuristic.get("match_count", 0) + 1
-                cached_key["count"] = cached_key.get("count", 0) + 1
-                cached_key["example_values"] = cached_key.get("example_values", list())
-                if pdf_element.lower() not in cached_key["example_values"]:
-                    if len(cached_key["example_values"]) < self.__num_examples_per_key:
-                        cached_key["example_values"].append(pdf_element.lower())
-                    elif len(cached_key["example_values"]) == self.__num_examples_per_key:
-                        # Replace a random example to keep variety
-                        replace_index = random.randint(0, self.__num_examples_per_key - 1)
-                        cached_key["example_values"].pop(replace_index)
-                        cached_key["example_values"].append(pdf_element.lower())
-                        
+                key_count = cached_key.get("count", 0)
+                confidence[key] = round(min(1.0, record_heuristic.get("match_count", 0) / key_count), 3) if key_count else 0.0
+                self.__store.record_match(label, key, position, pdf_element.lower(), self.__num_examples_per_key)
+
                 break  # Stop trying other heuristics for this key
             
             else:
                 logger.debug(f"No matching heuristic found for key {key} under label {label}")
         
-        return partial_result
+        return partial_result, confidence
 
     def heuristic_update(self, result: Dict[str, str], label: str, pdf_matrix: PDF2Matrix) -> None:
         """
@@ -150,72 +171,17 @@ class Heuristic:
         if not result or label is None:
             return
 
-        if label not in self.__cache:
-            self.__cache[label] = dict()
-
         for key, value in result.items():
             if not value: # Skip empty or null values
                 continue
             value_type = self.__type_resolver.resolve(value)
-            
-            if key not in self.__cache[label]: # New key for this label
-                self.__cache[label][key] = {
-                    "count": 0,
-                    "heuristics": list(),
-                }
-            cached_key = self.__cache[label][key]
-
-            # Update key stats
-            cached_key["count"] = cached_key.get("count", 0) + 1
-            if not cached_key.get("type"):
-                cached_key["type"] = value_type
-            elif value_type != cached_key.get("type"):
-                cached_key["type_mismatch"] = cached_key.get("type_mismatch", 0) + 1
-                if cached_key["type_mismatch"] > 5:
-                    cached_key["type_mismatch"] = 0
-                    cached_key["type"] = value_type
-                    logger.debug(f"Type for key {key} under label {label} changed to {value_type} due to repeated mismatches.")
-
-            cached_key["example_values"] = cached_key.get("example_values", list())
-            if value.lower() not in cached_key["example_values"]:
-                if len(cached_key["example_values"]) < self.__num_examples_per_key:
-                    cached_key["example_values"].append(value.lower())
-                elif len(cached_key["example_values"]) == self.__num_examples_per_key:
-                    # Replace a random example to keep variety
-                    replace_index = random.randint(0, self.__num_examples_per_key - 1)
-                    cached_key["example_values"].pop(replace_index)
-                    cached_key["example_values"].append(value.lower())
-
             value_position = pdf_matrix.get_position_of_text(value)
-            if value_position is None: # Unable to locate value in PDF matrix
-                continue
 
-            # Heuristic record includes mean_length and sample_count for robust length checks
-            heuristic_definition = {
-                "position": value_position,
-                "match_count": 1,
-            }
-
-            # If string, store length stats
-            if value_type == "string":
-                heuristic_definition["mean_length"] = len(value)
-
-            # Merge into existing heuristics: if same position+type exists, update stats
-            heuristics = self.__cache[label][key]["heuristics"]
-            for rec in heuristics:
-                if rec.get("position") == value_position and rec.get("type") == value_type:
-                    rec["match_count"] = rec.get("match_count", 0) + 1
-
-                    if value_type == "string":
-                        prev_mean = rec.get("mean_length", 0)
-                        new_count = rec["match_count"]
-                        prev_count = new_count - 1
-                        rec["mean_length"] = (prev_mean * prev_count + len(value)) / new_count
-
-                    break
-            else: # New heuristic for this key
-                heuristics.append(heuristic_definition)
-
-            # Keep top heuristics by match_count
-            heuristics.sort(key=lambda x: x.get("match_count", 0), reverse=True)
-            cached_key["heuristics"] = heuristics[:self.__num_heuristics_per_key]
\ No newline at end of file
+            previous_type, key_type = self.__store.record_observation(
+                label, key, value, value_type,
+                position=list(value_position) if value_position is not None else None,
+                max_heuristics=self.__num_heuristics_per_key,
+                max_examples=self.__num_examples_per_key,
+            )
+            if previous_type and key_type != previous_type:
+                logger.debug(f"Type for key {key} under label {label} changed to {key_type} due to repeated mismatches.")
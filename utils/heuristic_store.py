@@ -0,0 +1,456 @@
+"""
+Storage backends for the heuristic cache used by utils.heuristic.Heuristic.
+
+- InMemoryHeuristicStore: compact records private to the process, with an optional memory budget
+  enforced by evicting the least recently used labels (then the least requested keys).
+- SQLiteHeuristicStore: a local SQLite database in WAL mode shared by several worker processes on
+  the same host. Counters are incremented atomically in SQL, top-K pruning is done in SQL and reads
+  go through an in-process cache invalidated by TTL, so hot-path lookups stay in memory.
+
+Both backends expose the records of a label in the cache format documented in the README:
+{key: {"count", "type", "example_values", "heuristics": [{"position", "match_count", "mean_length"}]}}.
+"""
+
+from array import array
+from collections import OrderedDict
+from collections.abc import Mapping
+from contextlib import contextmanager
+from math import isnan, nan
+from pathlib import Path
+from time import monotonic
+from typing import Dict, List
+import json
+import os
+import random
+import sqlite3
+import sys
+import threading
+
+DICT_ENTRY_BYTES = 3 * 8 # Hash, key and value pointers of a dict slot
+ODICT_NODE_BYTES = 7 * 8 # Dict slot plus the linked-list node of an OrderedDict entry
+
+def add_example(examples: List[str], value: str, max_examples: int) -> List[str]:
+    """
+    Add value to the list of examples, replacing a random one when the list is full to keep variety.
+    """
+    if value in examples:
+        return examples
+    if len(examples) < max_examples:
+        examples.append(value)
+    else:
+        examples.pop(random.randint(0, max_examples - 1))
+        examples.append(value)
+    return examples
+
+class _KeyRecord:
+    """
+    Compact record of a key: heuristics are kept as parallel arrays (position tuples, match counts and
+    mean lengths, NaN when there is none) instead of one dict per heuristic.
+    """
+    __slots__ = ("count", "type", "type_mismatch", "example_values", "positions", "match_counts", "mean_lengths", "nbytes")
+
+    def __init__(self):
+        self.count = 0
+        self.type = None
+        self.type_mismatch = 0
+        self.example_values: List[str] = list()
+        self.positions: List[tuple] = list()
+        self.match_counts = array("L")
+        self.mean_lengths = array("d")
+        self.nbytes = 0
+
+    def find(self, position) -> int:
+        position = tuple(position)
+        for index, record_position in enumerate(self.positions):
+            if record_position == position:
+                return index
+        return -1
+
+    def keep_top(self, max_heuristics: int) -> None:
+        """
+        Keep the max_heuristics heuristics with the highest match_count (stable, ties keep their order).
+        """
+        order = sorted(range(len(self.positions)), key=lambda i: self.match_counts[i], reverse=True)[:max_heuristics]
+        self.positions = [self.positions[i] for i in order]
+        self.match_counts = array("L", (self.match_counts[i] for i in order))
+        self.mean_lengths = array("d", (self.mean_lengths[i] for i in order))
+
+    def estimate_size(self, key: str) -> int:
+        """
+        Approximate bytes held by the record, its key and the dict slot pointing to it.
+        """
+        return (sys.getsizeof(self) + sys.getsizeof(key) + DICT_ENTRY_BYTES
+                + sys.getsizeof(self.example_values) + sum(sys.getsizeof(value) for value in self.example_values)
+                + sys.getsizeof(self.positions) + sum(sys.getsizeof(position) for position in self.positions)
+                + sys.getsizeof(self.match_counts) + sys.getsizeof(self.mean_lengths))
+
+    def as_dict(self) -> Dict:
+        """
+        The record in the cache format documented in the README.
+        """
+        heuristics = list()
+        for position, match_count, mean_length in zip(self.positions, self.match_counts, self.mean_lengths):
+            heuristic_record = {"position": list(position), "match_count": match_count}
+            if not isnan(mean_length):
+                heuristic_record["mean_length"] = mean_length
+            heuristics.append(heuristic_record)
+
+        record = {"count": self.count, "heuristics": heuristics, "type": self.type, "example_values": list(self.example_values)}
+        if self.type_mismatch:
+            record["type_mismatch"] = self.type_mismatch
+        return record
+
+class _LabelView(Mapping):
+    """
+    Read-only view of the key records of a label, materializing a key in the cache format only when read.
+    """
+    def __init__(self, records: Dict[str, _KeyRecord]):
+        self.__records = records
+
+    def __getitem__(self, key: str) -> Dict:
+        return self.__records[key].as_dict()
+
+    def __iter__(self):
+        return iter(self.__records)
+
+    def __len__(self) -> int:
+        return len(self.__records)
+
+class InMemoryHeuristicStore:
+    def __init__(self, max_bytes: int | None = None):
+        """
+        max_bytes is the (approximate) memory budget of the cache, None for unlimited. Past it, the least
+        recently used labels are evicted first, then the least requested keys of the label being updated.
+        """
+        self.__cache: OrderedDict[str, Dict[str, _KeyRecord]] = OrderedDict() # LRU order, most recent last
+        self.__max_bytes = max_bytes
+        self.__bytes = 0
+        self.evicted_labels = 0
+        self.evicted_keys = 0
+
+    @classmethod
+    def from_env(cls) -> "InMemoryHeuristicStore":
+        """
+        Budget from HEURISTIC_CACHE_MAX_MB (unset or 0 = unlimited).
+        """
+        max_mb = float(os.getenv("HEURISTIC_CACHE_MAX_MB", "0"))
+        return cls(max_bytes=int(max_mb * 1024 * 1024) or None)
+
+    def get_label(self, label: str) -> Mapping[str, Dict]:
+        """
+        Return the key records of a label (empty if unknown). The result must not be mutated.
+        """
+        records = self.__cache.get(label)
+        if records is None:
+            return _LabelView(dict())
+        self.__cache.move_to_end(label)
+        return _LabelView(records)
+
+    def record_match(self, label: str, key: str, position: list, example_value: str, max_examples: int) -> None:
+        """
+        Register that the heuristic at position filled key (preprocessing hit).
+        """
+        cached_key = self.__cache.get(label, dict()).get(key)
+        if cached_key is None: # Evicted since the caller read the label
+            return
+        self.__cache.move_to_end(label)
+        index = cached_key.find(position)
+        if index >= 0:
+            cached_key.match_counts[index] += 1
+        cached_key.count += 1
+        add_example(cached_key.example_values, example_value, max_examples)
+        self.__resize(label, key, cached_key)
+
+    def record_observation(self, label: str, key: str, value: str, value_type: str, position: list | None,
+                           max_heuristics: int, max_examples: int) -> tuple:
+        """
+        Register a value extracted by the LLM and, if it was located in the PDF, the heuristic for its position.
+        Returns the type stored for the key before and after the update (None before the first observation).
+        """
+        records = self.__cache.get(label)
+        if records is None:
+            records = self.__cache[label] = dict()
+            self.__bytes += self.__label_size(label, records)
+        self.__cache.move_to_end(label)
+        cached_key = records.get(key)
+        if cached_key is None:
+            cached_key = records[sys.intern(key)] = _KeyRecord() # Key names repeat across labels
+
+        value_type = sys.intern(value_type)
+        previous_type = cached_key.type
+        cached_key.count += 1
+        if not cached_key.type:
+            cached_key.type = value_type
+        elif value_type != cached_key.type:
+            cached_key.type_mismatch += 1
+            if cached_key.type_mismatch > 5:
+                cached_key.type_mismatch = 0
+                cached_key.type = value_type
+
+        add_example(cached_key.example_values, value.lower(), max_examples)
+
+        if position is not None: # Value located in PDF matrix
+            index = cached_key.find(position)
+            if index >= 0:
+                cached_key.match_counts[index] += 1
+                if value_type == "string":
+                    prev_mean = cached_key.mean_lengths[index]
+                    new_count = cached_key.match_counts[index]
+                    prev_mean = 0 if isnan(prev_mean) else prev_mean
+                    cached_key.mean_lengths[index] = (prev_mean * (new_count - 1) + len(value)) / new_count
+            else: # New heuristic for this key
+                cached_key.positions.append(tuple(position))
+                cached_key.match_counts.append(1)
+                cached_key.mean_lengths.append(len(value) if value_type == "string" else nan)
+
+            # Keep top heuristics by match_count
+            cached_key.keep_top(max_heuristics)
+
+        self.__resize(label, key, cached_key)
+        return previous_type, cached_key.type
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Size and eviction counters of the cache.
+        """
+        return {
+            "labels": len(self.__cache),
+            "keys": sum(len(records) for records in self.__cache.values()),
+            "approx_bytes": self.__bytes,
+            "evicted_labels": self.evicted_labels,
+            "evicted_keys": self.evicted_keys,
+        }
+
+    def dump(self) -> Dict[str, Dict[str, Dict]]:
+        return {label: {key: record.as_dict() for key, record in records.items()} for label, records in self.__cache.items()}
+
+    def __resize(self, label: str, key: str, cached_key: _KeyRecord) -> None:
+        """
+        Update the size accounting after a change to cached_key and evict until back within budget.
+        """
+        nbytes = cached_key.estimate_size(key)
+        self.__bytes += nbytes - cached_key.nbytes
+        cached_key.nbytes = nbytes
+        if self.__max_bytes is None:
+            return
+
+        while self.__bytes > self.__max_bytes:
+            coldest_label = next(iter(self.__cache))
+            if coldest_label != label: # Least recently used label
+                records = self.__cache.pop(coldest_label)
+                self.__bytes -= self.__label_size(coldest_label, records) + sum(record.nbytes for record in records.values())
+                self.evicted_labels += 1
+                self.evicted_keys += len(records)
+                continue
+
+            # Only the current label is left: least requested keys other than the one just updated
+            records = self.__cache[label]
+            candidates = [k for k in records if k != key]
+            if not candidates:
+                break # A single key larger than the budget is kept
+            coldest_key = min(candidates, key=lambda k: records[k].count)
+            self.__bytes -= records.pop(coldest_key).nbytes
+            self.evicted_keys += 1
+
+    @staticmethod
+    def __label_size(label: str, records: dict) -> int:
+        """
+        Bytes held by a label entry besides its key records (the empty dict size, so the estimate
+        doesn't change as the dict grows).
+        """
+        return sys.getsizeof(label) + sys.getsizeof(dict()) + ODICT_NODE_BYTES
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS heuristic_keys (
+    label TEXT NOT NULL,
+    key TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    type TEXT,
+    type_mismatch INTEGER NOT NULL DEFAULT 0,
+    example_values TEXT NOT NULL DEFAULT '[]',
+    PRIMARY KEY (label, key)
+);
+CREATE TABLE IF NOT EXISTS heuristic_positions (
+    label TEXT NOT NULL,
+    key TEXT NOT NULL,
+    position TEXT NOT NULL,
+    match_count INTEGER NOT NULL DEFAULT 0,
+    mean_length REAL,
+    PRIMARY KEY (label, key, position)
+);
+"""
+
+class SQLiteHeuristicStore:
+    def __init__(self, db_path: str | Path, cache_ttl_seconds: float = 5.0, busy_timeout_seconds: float = 30.0):
+        """
+        Open (or create) the database. WAL mode lets readers proceed while one worker writes; it requires
+        every worker to run on the same host as the file (not a network file system).
+        """
+        self.__ttl = cache_ttl_seconds
+        self.__read_cache: Dict[str, tuple] = dict() # label -> (expires_at, records)
+        self.__lock = threading.Lock()
+        self.__conn = sqlite3.connect(db_path, timeout=busy_timeout_seconds, isolation_level=None, check_same_thread=False)
+        self.__conn.execute("PRAGMA journal_mode=WAL")
+        self.__conn.execute("PRAGMA synchronous=NORMAL")
+        self.__conn.executescript(SCHEMA)
+
+    def get_label(self, label: str) -> Dict[str, Dict]:
+        """
+        Return the key records of a label, served from the in-process cache while it is fresh.
+        """
+        with self.__lock:
+            cached = self.__read_cache.get(label)
+            if cached is not None and cached[0] > monotonic():
+                return cached[1]
+
+            records = self.__load_label(label)
+            now = monotonic()
+            # Drop expired entries so labels that stopped appearing don't stay in memory
+            self.__read_cache = {cached_label: entry for cached_label, entry in self.__read_cache.items() if entry[0] > now}
+            self.__read_cache[label] = (now + self.__ttl, records)
+            return records
+
+    def record_match(self, label: str, key: str, position: list, example_value: str, max_examples: int) -> None:
+        with self.__lock, self.__transaction():
+            self.__conn.execute(
+                "UPDATE heuristic_positions SET match_count = match_count + 1 WHERE label = ? AND key = ? AND position = ?",
+                (label, key, json.dumps(position)),
+            )
+            self.__conn.execute("UPDATE heuristic_keys SET count = count + 1 WHERE label = ? AND key = ?", (label, key))
+            self.__update_examples(label, key, example_value, max_examples)
+            self.__refresh_cached_key(label, key)
+
+    def record_observation(self, label: str, key: str, value: str, value_type: str, position: list | None,
+                           max_heuristics: int, max_examples: int) -> tuple:
+        with self.__lock, self.__transaction():
+            previous_type = self.__conn.execute(
+                "SELECT type FROM heuristic_keys WHERE label = ? AND key = ?", (label, key)
+            ).fetchone()
+            # Type switches after more than 5 consecutive mismatches (SET expressions see the old row)
+            self.__conn.execute(
+                """
+                INSERT INTO heuristic_keys (label, key, count, type) VALUES (?, ?, 1, ?)
+                ON CONFLICT (label, key) DO UPDATE SET
+                    count = count + 1,
+                    type = CASE
+                        WHEN type IS NULL THEN excluded.type
+                        WHEN type != excluded.type AND type_mismatch + 1 > 5 THEN excluded.type
+                        ELSE type END,
+                    type_mismatch = CASE
+                        WHEN type IS NULL OR type = excluded.type THEN type_mismatch
+                        WHEN type_mismatch + 1 > 5 THEN 0
+                        ELSE type_mismatch + 1 END
+                """,
+                (label, key, value_type),
+            )
+            self.__update_examples(label, key, value.lower(), max_examples)
+
+            if position is not None:
+                is_string = value_type == "string"
+                self.__conn.execute(
+                    """
+                    INSERT INTO heuristic_positions (label, key, position, match_count, mean_length) VALUES (?, ?, ?, 1, ?)
+                    ON CONFLICT (label, key, position) DO UPDATE SET
+                        match_count = match_count + 1,
+                        mean_length = CASE WHEN ? THEN (COALESCE(mean_length, 0.0) * match_count + ?) / (match_count + 1.0)
+                                      ELSE mean_length END
+                    """,
+                    (label, key, json.dumps(position), len(value) if is_string else None, is_string, len(value)),
+                )
+                # Keep top heuristics by match_count (ties: oldest first)
+                self.__conn.execute(
+                    """
+                    DELETE FROM heuristic_positions WHERE label = ? AND key = ? AND rowid NOT IN (
+                        SELECT rowid FROM heuristic_positions WHERE label = ? AND key = ?
+                        ORDER BY match_count DESC, rowid ASC LIMIT ?
+                    )
+                    """,
+                    (label, key, label, key, max_heuristics),
+                )
+
+            key_type = self.__conn.execute(
+                "SELECT type FROM heuristic_keys WHERE label = ? AND key = ?", (label, key)
+            ).fetchone()[0]
+            self.__refresh_cached_key(label, key)
+            return (previous_type[0] if previous_type else None), key_type
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Size of the in-process read cache (the records themselves live in the database).
+        """
+        return {"cached_labels": len(self.__read_cache)}
+
+    def dump(self) -> Dict[str, Dict[str, Dict]]:
+        with self.__lock:
+            labels = [row[0] for row in self.__conn.execute("SELECT DISTINCT label FROM heuristic_keys ORDER BY label")]
+            return {label: self.__load_label(label) for label in labels}
+
+    def close(self) -> None:
+        self.__conn.close()
+
+    @contextmanager
+    def __transaction(self):
+        """
+        BEGIN IMMEDIATE takes the write lock up front, so read-modify-write steps (example values)
+        can't interleave with other workers.
+        """
+        self.__conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self.__conn.execute("ROLLBACK")
+            raise
+        self.__conn.execute("COMMIT")
+
+    def __update_examples(self, label: str, key: str, example_value: str, max_examples: int) -> None:
+        row = self.__conn.execute(
+            "SELECT example_values FROM heuristic_keys WHERE label = ? AND key = ?", (label, key)
+        ).fetchone()
+        if row is None:
+            return
+        examples = add_example(json.loads(row[0]), example_value, max_examples)
+        self.__conn.execute(
+            "UPDATE heuristic_keys SET example_values = ? WHERE label = ? AND key = ?",
+            (json.dumps(examples, ensure_ascii=False), label, key),
+        )
+
+    def __refresh_cached_key(self, label: str, key: str) -> None:
+        """
+        After a write, reload the written key into the cached records of its label (if cached), instead of
+        dropping the whole label: the next lookups stay in memory, and the TTL still bounds how long
+        writes of other workers take to show up.
+        """
+        cached = self.__read_cache.get(label)
+        if cached is None:
+            return
+        records = self.__load_label(label, key)
+        if key in records:
+            cached[1][key] = records[key]
+
+    def __load_label(self, label: str, key: str | None = None) -> Dict[str, Dict]:
+        """
+        Load the records of a label (only those of key, if given) in the cache format.
+        """
+        key_filter, params = ("AND key = ?", (label, key)) if key is not None else ("", (label,))
+        records = dict()
+        for key, count, key_type, type_mismatch, example_values in self.__conn.execute(
+            f"SELECT key, count, type, type_mismatch, example_values FROM heuristic_keys WHERE label = ? {key_filter}", params
+        ):
+            records[key] = {"count": count, "heuristics": list(), "type": key_type, "example_values": json.loads(example_values)}
+            if type_mismatch:
+                records[key]["type_mismatch"] = type_mismatch
+
+        for key, position, match_count, mean_length in self.__conn.execute(
+            f"""
+            SELECT key, position, match_count, mean_length FROM heuristic_positions
+            WHERE label = ? {key_filter} ORDER BY key, match_count DESC, rowid ASC
+            """,
+            params,
+        ):
+            if key not in records:
+                continue
+            heuristic_record = {"position": json.loads(position), "match_count": match_count}
+            if mean_length is not None:
+                heuristic_record["mean_length"] = mean_length
+            records[key]["heuristics"].append(heuristic_record)
+        return records
@@ -0,0 +1,127 @@
+"""
+Streaming readers for the input manifest.
+Supports a JSON array (the original format) and JSON Lines (one item per line). Items are decoded
+incrementally, so memory stays constant and processing can start before the whole file is read.
+"""
+
+from pathlib import Path
+import json
+import os
+
+CHUNK_SIZE = 1 << 16 # Characters read per chunk when streaming a JSON array
+NUMBER_CHARS = frozenset("0123456789.eE+-") # Characters that can continue a JSON number
+# JSON arrays up to this size are pre-counted (a streaming pass of a few ms per MB); larger ones are not,
+# so huge manifests don't pay a second full decode before the first item is processed
+COUNT_JSON_ITEMS_MAX_BYTES = 10 * (1 << 20)
+
+class InputFormatError(ValueError):
+    """
+    Raised when the input manifest is not a valid JSON array / JSON Lines file.
+    """
+
+def is_jsonl(path: str | Path) -> bool:
+    return Path(path).suffix.lower() in (".jsonl", ".ndjson")
+
+def iter_input_items(path: str | Path):
+    """
+    Yield the items of the input manifest one at a time.
+    """
+    if is_jsonl(path):
+        yield from _iter_jsonl(path)
+    else:
+        yield from _iter_json_array(path)
+
+def count_input_items(path: str | Path) -> int | None:
+    """
+    Count the items of the input manifest without decoding them into memory at once.
+    JSON Lines are counted by their non-empty lines (a cheap byte scan). JSON arrays are counted by a
+    streaming pass when they are at most COUNT_JSON_ITEMS_MAX_BYTES; larger ones return None (unknown).
+    """
+    if is_jsonl(path):
+        with open(path, "rb") as f:
+            return sum(1 for line in f if line.strip())
+
+    if os.path.getsize(path) > COUNT_JSON_ITEMS_MAX_BYTES:
+        return None
+    return sum(1 for _ in _iter_json_array(path))
+
+def _iter_jsonl(path: str | Path):
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                raise InputFormatError(f"Invalid JSON at line {line_number} of {path}: {e}") from e
+
+def _iter_json_array(path: str | Path):
+    decoder = json.JSONDecoder()
+    with open(path, encoding="utf-8") as f:
+        buffer = ""
+        pos = 0
+        eof = False
+
+        def fill() -> bool:
+            """
+            Drop the consumed part of the buffer and read the next chunk. Returns False at end of file.
+            """
+            nonlocal buffer, pos, eof
+            if eof:
+                return False
+            chunk = f.read(CHUNK_SIZE)
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            eof = not chunk
+            return bool(chunk)
+
+        def skip_whitespace():
+            nonlocal pos
+            while True:
+                while pos < len(buffer) and buffer[pos].isspace():
+                    pos += 1
+                if pos < len(buffer) or not fill():
+                    return
+
+        skip_whitespace()
+        if pos >= len(buffer) or buffer[pos] != "[":
+            raise InputFormatError(f"{path} is not a JSON array.")
+        pos += 1
+
+        expect_item = True
+        first = True
+        while True:
+            skip_whitespace()
+            if pos >= len(buffer):
+                raise InputFormatError(f"Unexpected end of file in {path}.")
+
+            char = buffer[pos]
+            if char == "]" and (first or not expect_item):
+                return
+            if not expect_item:
+                if char != ",":
+                    raise InputFormatError(f"Expected ',' or ']' in {path}.")
+                pos += 1
+                expect_item = True
+                continue
+
+            # Decode the next item, reading more chunks while it is incomplete
+            while True:
+                try:
+                    item, end = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError as e:
+                    if fill():
+                        continue
+                    raise InputFormatError(f"Invalid JSON in {path}: {e}") from e
+                # A number may be cut at the chunk boundary ("1." | "5e3" decodes as 1): re-read while
+                # it is followed by the end of the buffer or a character that could continue it
+                if (isinstance(item, (int, float)) and not isinstance(item, bool)
+                        and (end == len(buffer) or buffer[end] in NUMBER_CHARS) and fill()):
+                    continue
+                break
+
+            pos = end
+            first = False
+            expect_item = False
+            yield item
@@ -2,13 +2,112 @@
 This module provides a class to convert PDF documents into a matrix representation
 based on the spatial arrangement of text boxes. It also includes functionality to
 locate the position of specific text within the matrix. Only horizontal text boxes are considered.
+
+The matrix is page-aware: each page is laid out independently (rows never merge text of
+different pages) and positions are (page, row, col), so a change in the length of an earlier
+page doesn't shift positions on later pages. Long documents have their pages parsed in parallel
+by worker processes.
 """
 
 from pdfminer.high_level import extract_pages
 from pdfminer.layout import LTTextBoxHorizontal
+from pdfminer.pdfpage import PDFPage
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import repeat
+import multiprocessing
+import os
 import re
+import logging
 import editdistance
 
+logger = logging.getLogger("my_logger")
+
+PARALLEL_MIN_PAGES = 4 # Below this, process start-up and IPC cost more than parsing serially
+PDF_PARSE_WORKERS = int(os.getenv("PDF_PARSE_WORKERS", "0")) or os.cpu_count() or 1
+
+_process_pool = None # Created on first parallel parse, shared by every PDF2Matrix until shutdown_process_pool()
+
+def normalize_text(text: str) -> str:
+    """
+    Basic preprocessing applied to every text of the matrix: lowercase, stripped, single spaces.
+    """
+    return re.sub(r"\s+", " ", text.strip().lower())
+
+def render_matrix(matrix: list[list[str]]) -> str:
+    """
+    Render the matrix as text, one "Row i: cell | cell" line per row (the format sent to the LLM).
+    """
+    return "\n".join(f"Row {i+1}: " + " | ".join(row) for i, row in enumerate(matrix))
+
+def _extract_text_boxes(page_layout):
+    boxes = list()
+    for element in page_layout:
+        if isinstance(element, LTTextBoxHorizontal):
+            x0, y0, x1, y1 = element.x0, element.y0, element.x1, element.y1
+            text = normalize_text(element.get_text())  # basic preprocessing
+            if text:  # only consider non-empty text boxes
+                boxes.append({
+                    "text": text,
+                    "x0": x0, "y0": y0, "x1": x1, "y1": y1,
+                    "cx": (x0 + x1) / 2,
+                    "cy": (y0 + y1) / 2,
+                })
+    return boxes
+
+def _group_into_rows(boxes, y_threshold=20):
+    rows = list()
+    for box in sorted(boxes, key=lambda b: -b["cy"]):  # top to bottom
+        for row in rows:
+            if abs(row["cy"] - box["cy"]) < y_threshold:
+                row["items"].append(box)
+                break
+        else: # not placed in any existing row
+            rows.append({"cy": box["cy"], "items": [box]})
+
+    return rows
+
+def _sort_row_items(rows):
+    for row in rows:
+        row["items"] = sorted(row["items"], key=lambda b: b["cx"])
+    return rows
+
+def _rows_to_matrix(rows):
+    matrix = list()
+    for row in rows:
+        matrix.append([item["text"] for item in row["items"]])
+    return matrix
+
+def _page_layout_to_matrix(page_layout) -> list[list[str]]:
+    rows = _group_into_rows(_extract_text_boxes(page_layout))
+    return _rows_to_matrix(_sort_row_items(rows))
+
+def _parse_page(pdf_path: str, page_index: int) -> list[list[str]]:
+    """
+    Matrix of a single page. Module-level so that it can run in worker processes.
+    """
+    for page_layout in extract_pages(pdf_path, page_numbers=[page_index]):
+        return _page_layout_to_matrix(page_layout)
+    return list()
+
+def _get_process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    if _process_pool is None:
+        # Not fork: by then the process runs other threads (debug sink, two-phase/hedging pools), and
+        # forking a multi-threaded process may deadlock the children. forkserver doesn't exist on Windows
+        start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        _process_pool = ProcessPoolExecutor(max_workers=PDF_PARSE_WORKERS, mp_context=multiprocessing.get_context(start_method))
+    return _process_pool
+
+def shutdown_process_pool() -> None:
+    """
+    Stop the page parsing workers (if started). A later parallel parse starts a new pool.
+    """
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown()
+        _process_pool = None
+
 class PDF2Matrix:
     def __init__(self, pdf_path):
         self.pdf_path = pdf_path
@@ -16,85 +115,70 @@ class PDF2Matrix:
     def create_matrix_representation(self) -> list[list[str]]:
         """
         Convert the PDF into a matrix representation based on text box positions.
-        Returns a 2D list (matrix) where each sublist represents a row of text.
+        Returns a 2D list (matrix) where each sublist represents a row of text, the rows of each page
+        following the rows of the previous one (see get_pages() for the per-page matrices).
         All text is converted to lowercase and stripped of extra whitespace and the spaces are normalized.
         """
-        boxes = self.__extract_text_boxes_split()
-        rows = self.__group_into_rows(boxes)
-        rows = self.__sort_row_items(rows)
-        self.__pdf_mat = self.__rows_to_matrix(rows)
+        with open(self.pdf_path, "rb") as f:
+            page_count = sum(1 for _ in PDFPage.get_pages(f))
+
+        self.__pages = None
+        if page_count >= PARALLEL_MIN_PAGES and PDF_PARSE_WORKERS > 1:
+            try:
+                self.__pages = list(_get_process_pool().map(_parse_page, repeat(str(self.pdf_path)), range(page_count)))
+            except (BrokenProcessPool, OSError) as e: # Workers couldn't start or died: parse in this process
+                logger.warning(f"Parallel parsing of {self.pdf_path} failed ({e}), parsing it serially.")
+                shutdown_process_pool()
+        if self.__pages is None:
+            self.__pages = [_page_layout_to_matrix(page_layout) for page_layout in extract_pages(self.pdf_path)]
+
+        self.__pdf_mat = [row for page in self.__pages for row in page]
+        return self.__pdf_mat
+
+    def get_matrix(self) -> list[list[str]]:
+        """
+        Return the matrix built by create_matrix_representation().
+        """
         return self.__pdf_mat
 
+    def get_pages(self) -> list[list[list[str]]]:
+        """
+        Return the matrix of each page (page -> row -> col) built by create_matrix_representation().
+        """
+        return self.__pages
+
     def get_position_of_text(self, text: str) -> tuple | None:
         """
         Locate the position of the specified text in the PDF matrix.
         Returns a tuple if found, otherwise None.
 
-        The tuple format is:
-        - (row,) if the text matches an entire row
-        - (row, col) if the text matches a specific cell within a row
+        The tuple format is (page, row, col), rows being counted from the top of the page:
+        - (page, row, None) if the text matches an entire row
+        - (page, row, col) if the text matches a specific cell within a row
         """
 
         if not self.__pdf_mat or not text:
             return None
 
-        text = re.sub(r"\s+", " ", text.strip().lower()) # basic preprocessing - the same as during matrix creation
-        for row_index, row in enumerate(self.__pdf_mat):
-            if len(row) == 1:
-                if row[0] == text:
-                    return (row_index,)  # Return the position as (row,)
-
-            row_str = " ".join(row).lower()
-            if len(row_str) <= 10:
-                if row_str == text:
-                    return (row_index,)  # Return the position as (row,)
-                
-            # If the row is longer than 10 characters, allow fuzzy matching
-            elif editdistance.eval(row_str, text) / max(len(row_str), len(text)) < 0.10: # fuzzy match
-                return (row_index,)  # Return the position as (row,)
-
-            # Find exact match within the row
-            for col_index, col in enumerate(row):
-                if col == text:
-                    return (row_index, col_index)  # Return the position as (row, col)
-        
-        return None
-            
-    def __extract_text_boxes_split(self):
-        boxes = list()
-        for page_layout in extract_pages(self.pdf_path):
-            for element in page_layout:
-                if isinstance(element, LTTextBoxHorizontal):
-                    x0, y0, x1, y1 = element.x0, element.y0, element.x1, element.y1
-                    text = re.sub(r"\s+", " ", element.get_text().strip().lower())  # basic preprocessing
-                    if text:  # only consider non-empty text boxes
-                        boxes.append({
-                            "text": text,
-                            "x0": x0, "y0": y0, "x1": x1, "y1": y1,
-                            "cx": (x0 + x1) / 2,
-                            "cy": (y0 + y1) / 2,
-                        })
-        return boxes
-
-    def __group_into_rows(self, boxes, y_threshold=20):
-        rows = list()
-        for box in sorted(boxes, key=lambda b: -b["cy"]):  # top to bottom
-            for row in rows:
-                if abs(row["cy"] - box["cy"]) < y_threshold:
-                    row["items"].append(box)
-                    break
-            else: # not placed in any existing row
-                rows.append({"cy": box["cy"], "items": [box]})
-        
-        return rows
-
-    def __sort_row_items(self, rows):
-        for row in rows:
-            row["items"] = sorted(row["items"], key=lambda b: b["cx"])
-        return rows
+        text = normalize_text(text) # basic preprocessing - the same as during matrix creation
+        for page_index, page in enumerate(self.__pages):
+            for row_index, row in enumerate(page):
+                if len(row) == 1:
+                    if row[0] == text:
+                        return (page_index, row_index, None)  # Entire row
 
-    def __rows_to_matrix(self, rows):
-        matrix = list()
-        for row in rows:
-            matrix.append([item["text"] for item in row["items"]])
-        return matrix
+                row_str = " ".join(row).lower()
+                if len(row_str) <= 10:
+                    if row_str == text:
+                        return (page_index, row_index, None)  # Entire row
+
+                # If the row is longer than 10 characters, allow fuzzy matching
+                elif editdistance.eval(row_str, text) / max(len(row_str), len(text)) < 0.10: # fuzzy match
+                    return (page_index, row_index, None)  # Entire row
+
+                # Find exact match within the row
+                for col_index, col in enumerate(row):
+                    if col == text:
+                        return (page_index, row_index, col_index)  # Specific cell
+
+        return None
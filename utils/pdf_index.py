@@ -0,0 +1,78 @@
+"""
+Index of the PDFs available in the input directory.
+The directory tree (including nested subdirectories) is walked once and files are looked up by
+relative path or, when unambiguous, by file name in O(1). Files are hashed lazily on first use, so
+byte-identical PDFs resolve to the same canonical path and their parsed representation can be reused.
+"""
+
+from pathlib import Path
+import hashlib
+import logging
+import os
+
+logger = logging.getLogger("my_logger")
+
+HASH_CHUNK_SIZE = 1 << 20
+
+def file_content_hash(path: str | Path) -> str:
+    """
+    Return the SHA-256 hex digest of the file content.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class PDFIndex:
+    def __init__(self, root: str | Path):
+        self.__root = Path(root)
+        self.__by_relative_path: dict[str, Path] = dict()
+        self.__by_name: dict[str, Path | None] = dict() # None marks names present in more than one subdirectory
+        self.__hash_by_path: dict[Path, str] = dict()
+        self.__canonical_by_hash: dict[str, Path] = dict()
+
+        for dir_path, _, file_names in os.walk(self.__root):
+            for file_name in file_names:
+                if not file_name.lower().endswith(".pdf"):
+                    continue
+                path = Path(dir_path) / file_name
+                self.__by_relative_path[path.relative_to(self.__root).as_posix()] = path
+                self.__by_name[file_name] = None if file_name in self.__by_name else path
+
+        ambiguous = [name for name, path in self.__by_name.items() if path is None]
+        if ambiguous:
+            logger.warning(f"{len(ambiguous)} file name(s) appear in more than one subdirectory of {self.__root}; reference them by relative path.")
+
+    def __len__(self) -> int:
+        return len(self.__by_relative_path)
+
+    def __contains__(self, pdf_file_name: str) -> bool:
+        return self.find(pdf_file_name) is not None
+
+    def find(self, pdf_file_name: str) -> Path | None:
+        """
+        Return the path of a PDF given its path relative to the root (e.g. "sub/doc.pdf") or its
+        file name alone, if unique. Returns None if the file is not indexed.
+        """
+        key = Path(pdf_file_name).as_posix()
+        path = self.__by_relative_path.get(key)
+        if path is None and "/" not in key:
+            path = self.__by_name.get(key)
+        return path
+
+    def content_hash(self, path: Path) -> str:
+        """
+        Return the content hash of an indexed file, computing it on first use.
+        """
+        content_hash = self.__hash_by_path.get(path)
+        if content_hash is None:
+            content_hash = file_content_hash(path)
+            self.__hash_by_path[path] = content_hash
+        return content_hash
+
+    def canonical(self, path: Path) -> Path:
+        """
+        Return the first seen path with the same content as path (path itself if its content is new).
+        """
+        return self.__canonical_by_hash.setdefault(self.content_hash(path), path)
@@ -0,0 +1,419 @@
+"""
+Processing pipeline shared by the CLI and the Streamlit UI.
+Only lightweight modules are imported here; the LLM client is created on first use
+by LLMExtractor, so runs fully answered by the heuristic never pay for it.
+"""
+
+from utils.pdf2mat import PDF2Matrix, shutdown_process_pool
+from utils.heuristic import Heuristic
+from utils.heuristic_store import InMemoryHeuristicStore, SQLiteHeuristicStore
+from utils.LLM import LLMExtractor, is_fatal_error, is_connection_error
+from utils.results_store import ResultsStore, JSONArrayWriter, JSONLinesWriter
+from utils.input_stream import iter_input_items, count_input_items, InputFormatError
+from utils.pdf_index import PDFIndex
+from utils.routing import RoutingPolicy, TEXT_BASED
+from utils.evaluation import load_targets, field_accuracy
+from utils.hedging import Hedger, HedgeInfo
+from utils.debug_sink import DebugSink
+
+from time import time
+from pathlib import Path
+import os
+import logging
+import json
+import threading
+from datetime import datetime
+from collections import OrderedDict
+from itertools import chain
+from glob import glob
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED, ALL_COMPLETED
+
+logger = logging.getLogger("my_logger")
+
+HEURISTIC_DB_PATH = os.getenv("HEURISTIC_DB_PATH") # Optional SQLite file shared by workers on the same host
+# Without a shared database the cache stays in memory, bounded by HEURISTIC_CACHE_MAX_MB if set
+heuristic_store = SQLiteHeuristicStore(HEURISTIC_DB_PATH) if HEURISTIC_DB_PATH else InMemoryHeuristicStore.from_env()
+heuristic = Heuristic(store=heuristic_store)
+llm_extractor = LLMExtractor()
+results_store = ResultsStore()
+routing_policy = RoutingPolicy.from_env()
+hedger = Hedger.from_env() # None unless LLM_HEDGING=1
+debug_sink = DebugSink.from_env()
+
+INPUT_DIR = Path("files") # Where PDFs are stored (subdirectories included)
+ROUTING_TARGETS_JSON = os.getenv("ROUTING_TARGETS_JSON", "target/dataset_targets.json") # Accuracy feedback for routing
+MATRIX_CACHE_SIZE = 64 # Parsed PDFs kept for byte-identical files referenced again
+# Send only the pages where values of the label were found before in native-PDF extraction. A value on a page
+# outside the learned set can't be found in the trimmed file, so keys answered null by a trimmed call are asked
+# again with the whole file (and the pages where they are found join the set)
+NATIVE_PDF_TRIM_PAGES = os.getenv("NATIVE_PDF_TRIM_PAGES", "0") == "1"
+# Emit provisional (heuristic-only) records immediately and complete them asynchronously with the LLM
+TWO_PHASE_RESULTS = os.getenv("TWO_PHASE_RESULTS", "0") == "1"
+TWO_PHASE_MAX_PENDING = int(os.getenv("TWO_PHASE_MAX_PENDING", "8")) # Concurrent LLM calls in two-phase mode
+# Consecutive calls failing to reach the API after which it is taken as unreachable and the run aborts
+LLM_MAX_CONNECTION_ERRORS = int(os.getenv("LLM_MAX_CONNECTION_ERRORS", "3"))
+
+connection_errors = 0 # Consecutive LLM calls that couldn't reach the API
+connection_errors_lock = threading.Lock()
+
+def load_routing_targets() -> dict:
+    """
+    Load the targets used as accuracy feedback by the routing policy. On the first run (no learned
+    statistics yet), the policy is also warmed up from the existing results_*.json files.
+    """
+    targets = dict()
+    if ROUTING_TARGETS_JSON and os.path.isfile(ROUTING_TARGETS_JSON):
+        try:
+            targets = load_targets(ROUTING_TARGETS_JSON)
+        except (InputFormatError, KeyError) as e:
+            logger.warning(f"Couldn't load routing targets from {ROUTING_TARGETS_JSON}: {e}")
+
+    if not routing_policy.has_history():
+        for results_json in sorted(glob("results_*.json")):
+            try:
+                for record in iter_input_items(results_json):
+                    metadata = record["metadata"]
+                    expected = targets.get((metadata["label"], metadata["pdf_path"]))
+                    llm_keys = [k for k in record["extraction_schema"] if k not in metadata.get("heuristic_hits", list())]
+                    routing_policy.observe_record(record, field_accuracy(record["extraction_schema"], expected, llm_keys) if expected else None)
+            except (InputFormatError, KeyError, ValueError) as e:
+                logger.warning(f"Skipping {results_json} while warming up the routing policy: {e}")
+    return targets
+
+def call_llm(route, request_schema: dict, label: str, matrix, examples: dict | None, pdf_path: Path,
+             content_hash: str | None, pages: list[int] | None) -> tuple:
+    """
+    Run the LLM extraction of the keys not filled by the heuristic through the given route, hedging
+    slow calls when enabled. Returns (response, latency in seconds, HedgeInfo, fallback response), response being
+    None if the call failed (the document is then recorded as failed instead of aborting the run). Errors no
+    document can recover from (see is_fatal_error, or LLM_MAX_CONNECTION_ERRORS calls in a row not reaching
+    the API) are raised, aborting the run. The fallback response is the whole-file call made for the keys a
+    trimmed call (pages given) answered null, None otherwise.
+    Safe to run in a worker thread: it doesn't touch the heuristic cache (examples are read beforehand by the caller).
+    """
+    global connection_errors
+
+    def extract(timeout=None):
+        if route.mode == TEXT_BASED:
+            return llm_extractor.extract_from_text_representation(input_schema=request_schema, label=label, matrix=matrix,
+                                                                  examples=examples, reasoning_effort=route.reasoning_effort,
+                                                                  timeout=timeout)
+        return llm_extractor.extract_from_native_pdf_file(input_schema=request_schema, pdf_path=pdf_path,
+                                                          content_hash=content_hash, pages=pages,
+                                                          reasoning_effort=route.reasoning_effort, timeout=timeout)
+
+    llm_start_time = time()
+    fallback_response = None
+    try:
+        if hedger is None:
+            response, hedge_info = extract(), HedgeInfo()
+        else:
+            response, hedge_info = hedger.run((label, route.mode), extract,
+                                              cost_of=lambda r: float(llm_extractor.usage_metadata(r)["estimated_cost_usd"]))
+
+        if pages is not None and response.output_parsed is not None:
+            # The values may be on pages outside the learned set: ask the null keys again with the whole file
+            answered = dict(response.output_parsed)
+            null_keys = {k: v for k, v in request_schema.items() if answered.get(k) is None}
+            if null_keys:
+                logger.debug(f"Trimmed call (pages {pages}) left {list(null_keys)} null for {pdf_path.name}, retrying with the whole file.")
+                fallback_response = llm_extractor.extract_from_native_pdf_file(input_schema=null_keys, pdf_path=pdf_path,
+                                                                               content_hash=content_hash,
+                                                                               reasoning_effort=route.reasoning_effort)
+    except Exception as e:
+        with connection_errors_lock:
+            connection_errors = connection_errors + 1 if is_connection_error(e) else 0
+            unreachable = connection_errors >= LLM_MAX_CONNECTION_ERRORS
+        if is_fatal_error(e) or unreachable:
+            raise
+        logger.error(f"LLM extraction ({route.name}) failed for {pdf_path.name}: {e}")
+        return None, time() - llm_start_time, HedgeInfo(), None
+
+    with connection_errors_lock:
+        connection_errors = 0
+    return response, time() - llm_start_time, hedge_info, fallback_response
+
+def run_processing(input_json_path: str, two_phase: bool | None = None):
+    """
+    Process the items of the input manifest, yielding (processed, total) for progress reporting.
+    two_phase defaults to the TWO_PHASE_RESULTS setting.
+    """
+    if two_phase is None:
+        two_phase = TWO_PHASE_RESULTS
+
+    if not input_json_path or not os.path.isfile(input_json_path):
+        logger.error(f"Input JSON file '{input_json_path}' does not exist.")
+        raise Exception("JSON inválido.")
+    
+    pdf_index = PDFIndex(INPUT_DIR) # Walked once, O(1) lookups per item
+    if len(pdf_index) == 0:
+        logger.error(f"No PDF files found in input directory '{INPUT_DIR}'.")
+        raise Exception(f"Nenhum PDF encontrado em {INPUT_DIR}.")
+
+    try:
+        total = count_input_items(input_json_path) # None if unknown (huge JSON arrays)
+        input_items = iter_input_items(input_json_path)
+        first_item = next(input_items, None)
+    except InputFormatError as e:
+        logger.error(f"Couldn't load {input_json_path}: {e}")
+        raise Exception(f"Erro ao ler o JSON de entrada '{input_json_path}'.")
+
+    processed = 0
+    if first_item is None:
+        logger.error(f"No data to process in JSON {input_json_path}.")
+        raise Exception(f"Nenhum dado a ser processado no JSON {input_json_path}.")
+
+    time_stamp = datetime.now().strftime("%y-%m-%d_%H-%M-%S")
+    output_json_path = f"results_{time_stamp}.json"
+    results_writer = JSONArrayWriter(output_json_path)
+    matrix_cache = OrderedDict() # canonical PDF path -> PDF2Matrix, for byte-identical PDFs
+    pages_by_label = dict() # label -> pages (0-based) where its values were located
+
+    disable_heuristic = False
+    targets = load_routing_targets()
+
+    # Two-phase mode: provisional records go to an events file right away, LLM calls run in background
+    # threads and final records are written to the results file in input order as they complete.
+    # Heuristic, routing and results updates stay on this thread.
+    if two_phase:
+        events_writer = JSONLinesWriter(f"results_{time_stamp}.events.jsonl")
+        executor = ThreadPoolExecutor(max_workers=TWO_PHASE_MAX_PENDING)
+    pending = dict() # record index -> (future, document)
+    completed = dict() # record index -> final record, waiting for earlier records
+    next_index = 0 # Next record index to be written to the results file
+
+    def finalize(document: dict, response, llm_latency: float | None, hedge_info: HedgeInfo | None,
+                 fallback_response=None) -> dict:
+        """
+        Merge the LLM output (if any) into the document, update heuristic/routing and build the final record.
+        fallback_response holds the whole-file answers for the keys a trimmed call left null (see call_llm).
+        """
+        result = document["result"]
+        decision = document["decision"]
+        label = document["item"]["label"]
+        pdf2matrix = document["pdf2matrix"]
+
+        parsed = response.output_parsed if response is not None else None
+        llm_failed = decision is not None and parsed is None # LLM needed, but the call or the parsing failed
+        if llm_failed: # The requested keys are unknown, not absent: written as null and flagged with llm_failed
+            result.update({key: None for key in document["request_schema"]})
+        if parsed is not None:
+            llm_formatted_output = dict(parsed)
+            if fallback_response is not None and fallback_response.output_parsed is not None:
+                llm_formatted_output.update({k: v for k, v in dict(fallback_response.output_parsed).items() if v is not None})
+            result.update(llm_formatted_output)
+
+            expected = targets.get((label, document["pdf_file_name"]))
+            usage = llm_extractor.usage_metadata(response, fallback_response)
+            routing_policy.observe(label, decision.route, latency_seconds=llm_latency,
+                                   cost_usd=float(usage["estimated_cost_usd"]), total_tokens=usage["total_tokens"],
+                                   accuracy=field_accuracy(llm_formatted_output, expected, document["request_schema"].keys()) if expected else None)
+
+            if pdf2matrix is not None:
+                heuristic.heuristic_update(result=llm_formatted_output, label=label, pdf_matrix=pdf2matrix)
+
+        if NATIVE_PDF_TRIM_PAGES and pdf2matrix is not None: # Learn which pages the label needs
+            for value in result.values():
+                position = pdf2matrix.get_position_of_text(value) if value else None
+                if position is not None:
+                    pages_by_label.setdefault(label, set()).add(position[0])
+
+        # Null values are legitimate (absent fields), so they don't make a document failed
+        failed = pdf2matrix is None or llm_failed
+        debug_output = debug_sink.submit(f"{time_stamp}_{document['index']:06d}_{Path(document['pdf_file_name']).stem}",
+                                         document["matrix"], failed)
+
+        elapsed_time = time() - document["start_time"]
+        logger.info(f"Processed {document['pdf_file_name']} in {elapsed_time:.2f} seconds.\n\n")
+
+        return {
+            "extraction_schema": result,
+            "metadata": {
+                "pdf_path": document["pdf_file_name"],
+                "label": label,
+                "version_used": decision.route.mode if decision else "heuristic_only",
+                "reasoning_effort": decision.route.reasoning_effort if decision else None,
+                "routing_reason": decision.reason if decision else None,
+                "llm_failed": llm_failed,
+                "latency_seconds": round(elapsed_time, 2),
+                "llm_latency_seconds": round(llm_latency, 2) if llm_latency is not None else None,
+                **llm_extractor.usage_metadata(response, fallback_response),
+                "pages_sent": document["pages"],
+                "pages_fallback": fallback_response is not None, # Null keys of the trimmed call asked with the whole file
+                "hedge_fired": hedge_info.fired if hedge_info else False,
+                "hedge_won": hedge_info.won if hedge_info else False,
+                "hedge_extra_cost_usd": f"{hedge_info.extra_cost_usd if hedge_info else 0:3e}",
+                "heuristic_hits": document["heuristic_hits"],
+                "key_confidence": document["key_confidence"],
+                "debug_output": debug_output,
+            }
+        }
+
+    def complete(index: int, record: dict) -> None:
+        """
+        Write a final record, keeping the results file in input order.
+        """
+        nonlocal next_index
+        if two_phase:
+            events_writer.write({"event": "final", "index": index, "record": record})
+        completed[index] = record
+        while next_index in completed:
+            results_writer.append(completed.pop(next_index))
+            next_index += 1
+
+    def drain(block: bool) -> None:
+        """
+        Finalize the finished LLM calls. With block=True, wait for at least one to finish.
+        """
+        if not pending:
+            return
+        futures = {future: index for index, (future, _) in pending.items()}
+        done, _ = wait(futures, return_when=FIRST_COMPLETED if block else ALL_COMPLETED, timeout=None if block else 0)
+        for future in sorted(done, key=futures.get):
+            index = futures[future]
+            _, document = pending.pop(index)
+            complete(index, finalize(document, *future.result()))
+
+    record_index = 0
+    try:
+        for item in chain([first_item], input_items):
+            yield processed, total # Streamlit progress bar update
+            processed += 1
+            if two_phase:
+                drain(block=len(pending) >= TWO_PHASE_MAX_PENDING)
+
+            start_time = time()
+            pdf_file_name = item["pdf_path"]
+
+            pdf_path = pdf_index.find(pdf_file_name)
+            if pdf_path is None:
+                logger.warning(f"File {pdf_file_name} not found in {INPUT_DIR}. Skipping...")
+                continue
+
+            logger.info(f"Processing file: {pdf_file_name}")
+
+            try:
+                canonical_path = pdf_index.canonical(pdf_path)
+                pdf2matrix = matrix_cache.get(canonical_path)
+                if pdf2matrix is None:
+                    pdf2matrix = PDF2Matrix(canonical_path)
+                    pdf2matrix.create_matrix_representation()
+                    matrix_cache[canonical_path] = pdf2matrix
+                    if len(matrix_cache) > MATRIX_CACHE_SIZE:
+                        matrix_cache.popitem(last=False)
+                else:
+                    logger.debug(f"Reusing matrix of identical file {canonical_path} for {pdf_file_name}")
+                    matrix_cache.move_to_end(canonical_path)
+                matrix = pdf2matrix.get_matrix()
+            except Exception as e:
+                logger.error(f"Error generating PDF matrix for {pdf_file_name}: {e}")
+                disable_heuristic = True # Disable heuristic (and the text path) for this iteration
+                pdf2matrix = matrix = None
+
+            request_schema = dict(item["extraction_schema"])
+
+            result = dict()
+            key_confidence = dict()
+            pages = None # Pages sent in native-PDF extraction (None = whole file)
+            decision = None # Routing decision, only taken when the LLM is needed
+            heuristic_hits = list()
+            if not disable_heuristic:
+                result, key_confidence = heuristic.heuristic_preprocessing_with_confidence(label=item["label"], request_schema=request_schema,
+                                                                                           pdf_matrix_representation=matrix, pdf_pages=pdf2matrix.get_pages())
+                heuristic_hits = list(result.keys())
+                logger.info(f"Heuristic hits for {pdf_file_name}: {heuristic_hits}")
+
+                # Remove already filled keys from the request schema
+                request_schema = {k: v for k, v in request_schema.items() if k not in heuristic_hits}
+
+            llm_call = None
+            # If heuristic didn't fill all keys, proceed with LLM extraction
+            if len(heuristic_hits) != len(item["extraction_schema"]):
+                heuristic_coverage = len(heuristic_hits) / len(item["extraction_schema"])
+                decision = routing_policy.choose(item["label"], heuristic_coverage, text_available=not disable_heuristic)
+                route = decision.route
+                if route.mode != TEXT_BASED and NATIVE_PDF_TRIM_PAGES and item["label"] in pages_by_label:
+                    pages = sorted(pages_by_label[item["label"]])
+                logger.debug(f"Using {route.mode} extraction ({route.reasoning_effort}) for {pdf_file_name}: {decision.reason}")
+                # Examples are read here: the heuristic cache is only accessed from this thread
+                examples = ({key: heuristic.get_examples_for_key(key, item["label"]) for key in request_schema}
+                            if route.mode == TEXT_BASED else None)
+                llm_call = partial(call_llm, route, request_schema, item["label"], matrix, examples, pdf_path,
+                                   pdf_index.content_hash(pdf_path) if route.mode != TEXT_BASED else None, pages)
+            else:
+                logger.info(f"All keys extracted via heuristic for {pdf_file_name}. Skipping LLM extraction.")
+
+            document = {
+                "item": item, "pdf_file_name": pdf_file_name, "start_time": start_time, "result": result,
+                "key_confidence": key_confidence, "heuristic_hits": heuristic_hits, "request_schema": request_schema,
+                "decision": decision, "pages": pages, "pdf2matrix": pdf2matrix if not disable_heuristic else None,
+                "matrix": matrix if not disable_heuristic else None, "index": record_index,
+            }
+
+            if not two_phase:
+                complete(record_index, finalize(document, *(llm_call() if llm_call else (None, None, None, None))))
+            else:
+                events_writer.write({"event": "provisional", "index": record_index, "record": {
+                    "extraction_schema": dict(result),
+                    "metadata": {
+                        "pdf_path": pdf_file_name,
+                        "label": item["label"],
+                        "latency_seconds": round(time() - start_time, 3),
+                        "heuristic_hits": heuristic_hits,
+                        "key_confidence": key_confidence,
+                        "pending_keys": list(request_schema.keys()) if llm_call else list(),
+                    },
+                }})
+                if llm_call:
+                    pending[record_index] = (executor.submit(llm_call), document)
+                else:
+                    complete(record_index, finalize(document, None, None, None))
+            record_index += 1
+        
+            # Reset for next iteration
+            disable_heuristic = False
+    except InputFormatError as e: # Invalid item found while streaming the input
+        logger.error(f"Couldn't load {input_json_path}: {e}")
+        if two_phase: # Finish the calls already in flight so their records aren't lost
+            while pending:
+                drain(block=True)
+            executor.shutdown()
+            events_writer.close()
+        results_writer.close() # Results of the items before the error stay valid JSON
+        shutdown_process_pool()
+        raise Exception(f"Erro ao ler o JSON de entrada '{input_json_path}'.") from e
+    except Exception: # LLM errors no document can recover from (see call_llm): the run stops
+        if two_phase:
+            executor.shutdown(cancel_futures=True)
+            events_writer.close()
+        results_writer.close() # Records written so far stay valid JSON
+        shutdown_process_pool()
+        raise
+
+    if two_phase:
+        while pending:
+            drain(block=True)
+        executor.shutdown()
+        events_writer.close()
+    results_writer.close()
+    shutdown_process_pool()
+    routing_policy.save()
+    debug_sink.flush()
+    if debug_sink.dropped:
+        logger.warning(f"{debug_sink.dropped} debug outputs dropped (writer queue full).")
+    if hedger is not None:
+        logger.info(f"Hedging: {hedger.hedges_fired} hedges fired out of {hedger.requests} requests, {hedger.hedges_won} won, "
+                    f"~${hedger.extra_cost_usd:.6f} extra.")
+    logger.info(f"Heuristic cache: {heuristic_store.stats()}")
+
+    try:
+        results_store.import_results_file(output_json_path)
+    except Exception as e: # The JSON results are already saved, the store can be backfilled later
+        logger.error(f"Couldn't append run {time_stamp} to the results store: {e}")
+
+    os.makedirs("debug_outputs", exist_ok=True)
+    with open(Path("debug_outputs") / "heuristic_cache.json", "w", encoding="utf-8") as f:
+        json.dump(heuristic.get_cache(), f, indent=4, ensure_ascii=False)
+
+    yield processed, total # Final update
@@ -0,0 +1,167 @@
+"""
+Columnar store for the results of every run.
+Each run's flattened metadata is appended as Parquet, partitioned by run and label
+(`<root>/run_id=<run>/label=<label>/*.parquet`), so the statistics view can query several runs
+at once and read only the partitions it needs. pandas/pyarrow are imported on use to keep
+the CLI startup cheap.
+"""
+
+from datetime import datetime
+from pathlib import Path
+import json
+import logging
+import re
+
+from utils.input_stream import iter_input_items
+
+logger = logging.getLogger("my_logger")
+
+RUN_ID_FORMAT = "%y-%m-%d_%H-%M-%S" # Same timestamp used in results_<run_id>.json
+RESULTS_FILE_PATTERN = re.compile(r"results_(.+)\.json$")
+PARTITION_COLS = ["run_id", "label"]
+
+class JSONArrayWriter:
+    """
+    Write records to a JSON array file one at a time.
+    The file is a valid JSON array after every append (the closing bracket is rewritten in place),
+    without keeping the records in memory or rewriting the whole file.
+    """
+    def __init__(self, path: str | Path):
+        self.__file = open(path, "wb")
+        self.__file.write(b"[]")
+        self.__file.flush()
+        self.__closing_offset = 1 # Byte offset right after the last record
+
+    def append(self, record: dict) -> None:
+        body = json.dumps(record, indent=4, ensure_ascii=False)
+        body = "\n".join("    " + line for line in body.split("\n"))
+        separator = "\n" if self.__closing_offset == 1 else ",\n"
+        data = (separator + body).encode("utf-8")
+
+        self.__file.seek(self.__closing_offset)
+        self.__file.write(data + b"\n]")
+        self.__file.flush()
+        self.__closing_offset += len(data)
+
+    def close(self) -> None:
+        self.__file.close()
+
+class JSONLinesWriter:
+    """
+    Append-only JSON Lines file, flushed after every line so consumers can tail it.
+    """
+    def __init__(self, path: str | Path):
+        self.__file = open(path, "w", encoding="utf-8")
+
+    def write(self, record: dict) -> None:
+        self.__file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.__file.flush()
+
+    def close(self) -> None:
+        self.__file.close()
+
+def flatten_record(record: dict, run_id: str) -> dict:
+    """
+    Flatten a results record ({"extraction_schema": ..., "metadata": ...}) into one row of scalar columns.
+    Non-scalar metadata (e.g. the heuristic_hits list) is summarized or dropped.
+    """
+    row = {"run_id": run_id, "num_keys_extracted": len(record["extraction_schema"])}
+    for key, value in record["metadata"].items():
+        if isinstance(value, (str, int, float, bool)) or value is None:
+            row[key] = value
+
+    row["estimated_cost_usd"] = float(row.get("estimated_cost_usd") or 0)
+    heuristic_hits = record["metadata"].get("heuristic_hits", list())
+    row["heuristic_hits_percent"] = (len(heuristic_hits) / row["num_keys_extracted"]) * 100 if row["num_keys_extracted"] > 0 else 0
+    return row
+
+def run_date(run_id: str) -> datetime | None:
+    """
+    Parse the date of a run from its id. Returns None if the id doesn't follow RUN_ID_FORMAT.
+    """
+    try:
+        return datetime.strptime(run_id, RUN_ID_FORMAT)
+    except ValueError:
+        return None
+
+class ResultsStore:
+    def __init__(self, root: str | Path = "results_store"):
+        self.__root = Path(root)
+
+    def list_runs(self) -> list[str]:
+        """
+        Return the ids of the runs present in the store, newest first.
+        """
+        if not self.__root.is_dir():
+            return list()
+        runs = [p.name.split("=", 1)[1] for p in self.__root.iterdir() if p.is_dir() and p.name.startswith("run_id=")]
+        return sorted(runs, reverse=True)
+
+    def append_run(self, run_id: str, records) -> int:
+        """
+        Append the flattened records (any iterable) of a run to the store, partitioned by run and label.
+        Returns the number of rows written.
+        """
+        rows = [flatten_record(record, run_id) for record in records]
+        if not rows:
+            return 0
+
+        import pandas as pd
+
+        df = pd.DataFrame(rows)
+        df.to_parquet(self.__root, partition_cols=PARTITION_COLS, index=False)
+        logger.debug(f"Appended {len(df)} rows of run {run_id} to {self.__root}")
+        return len(df)
+
+    def import_results_file(self, results_json_path: str | Path) -> int:
+        """
+        Backfill the store from a results_<run_id>.json file. Runs already stored are skipped.
+        Returns the number of rows written.
+        """
+        match = RESULTS_FILE_PATTERN.search(Path(results_json_path).name)
+        if match is None:
+            raise ValueError(f"Unexpected results file name: {results_json_path}")
+
+        run_id = match.group(1)
+        if run_id in self.list_runs():
+            return 0
+
+        return self.append_run(run_id, iter_input_items(results_json_path))
+
+    def load(self, runs: list[str] | None = None, labels: list[str] | None = None,
+             start: datetime | None = None, end: datetime | None = None):
+        """
+        Load the stored rows as a DataFrame, reading only the partitions matching the filters.
+        start/end filter on the run date (inclusive). Returns an empty DataFrame if nothing matches.
+        """
+        import pandas as pd
+
+        stored_runs = self.list_runs()
+        selected_runs = stored_runs if runs is None else [r for r in runs if r in stored_runs]
+        if start is not None or end is not None:
+            selected_runs = [
+                r for r in selected_runs
+                if (date := run_date(r)) is not None
+                and (start is None or date >= start)
+                and (end is None or date <= end)
+            ]
+        if not selected_runs:
+            return pd.DataFrame()
+
+        # Each run is read on its own: a dataset read takes its schema from the first (oldest) run,
+        # dropping columns added later and failing on columns that were all-null in that run
+        filters = [("label", "in", list(labels))] if labels is not None else None
+        frames = list()
+        for run_id in selected_runs:
+            run_df = pd.read_parquet(self.__root / f"run_id={run_id}", filters=filters)
+            if run_df.empty:
+                continue
+            run_df["run_id"] = run_id
+            run_df["label"] = run_df["label"].astype(str) # Partition column comes back as categorical
+            frames.append(run_df)
+        if not frames:
+            return pd.DataFrame()
+
+        df = pd.concat(frames, ignore_index=True)
+        df["run_date"] = pd.to_datetime(df["run_id"], format=RUN_ID_FORMAT, errors="coerce")
+        return df
@@ -0,0 +1,271 @@
+"""
+Cost/latency-aware routing between the extraction modes.
+For every label, the policy keeps running statistics of each route (extraction mode + reasoning
+effort) learned from past records: latency, tokens, estimated cost and, when targets are available,
+accuracy of the keys the LLM filled. It picks the cheapest route that is accurate enough and fits
+the configured latency/cost budget, so documents the text path can handle don't pay for native PDF.
+
+Without accuracy feedback, the text path is trusted only when the heuristic already covers more than
+`coverage_threshold` of the schema (the original rule). Accuracy is only trusted after a few samples,
+and routes ruled out by it are periodically retried, so a bad early stretch doesn't exclude them for good.
+
+Latency is always the latency of the LLM call (llm_latency_seconds in the records), which is what the
+route changes; records from before that field existed contribute cost and accuracy only.
+
+The statistics are shared by the runs using the same stats file: on save, what a run observed is
+added to the file as it is then (see save()), so concurrent runs don't overwrite each other.
+"""
+
+from dataclasses import dataclass, fields
+from pathlib import Path
+from typing import Dict, Optional
+import copy
+import json
+import logging
+import os
+
+from utils.file_lock import file_lock
+
+logger = logging.getLogger("my_logger")
+
+TEXT_BASED = "text_based"
+NATIVE_PDF = "native_pdf"
+
+@dataclass(frozen=True)
+class Route:
+    mode: str
+    reasoning_effort: str
+
+    @property
+    def name(self) -> str:
+        return f"{self.mode}:{self.reasoning_effort}"
+
+# Cheapest first (text-based is ~2.5x faster and ~2x cheaper than native PDF, see notes.md)
+ROUTES = [
+    Route(TEXT_BASED, "minimal"),
+    Route(TEXT_BASED, "low"),
+    Route(NATIVE_PDF, "minimal"),
+]
+FALLBACK_ROUTE = Route(NATIVE_PDF, "minimal")
+
+@dataclass
+class RoutingDecision:
+    route: Route
+    reason: str
+
+@dataclass
+class RouteStats:
+    count: int = 0
+    latency_count: int = 0
+    latency_sum: float = 0.0
+    cost_sum: float = 0.0
+    tokens_sum: int = 0
+    accuracy_sum: float = 0.0
+    accuracy_count: int = 0
+
+    def mean_latency(self) -> Optional[float]:
+        return self.latency_sum / self.latency_count if self.latency_count else None
+
+    def mean_cost(self) -> Optional[float]:
+        return self.cost_sum / self.count if self.count else None
+
+    def mean_accuracy(self) -> Optional[float]:
+        return self.accuracy_sum / self.accuracy_count if self.accuracy_count else None
+
+class RoutingPolicy:
+    def __init__(self, max_latency_seconds: Optional[float] = None, max_cost_usd: Optional[float] = None,
+                 min_accuracy: float = 0.9, coverage_threshold: float = 0.5, min_accuracy_samples: int = 3,
+                 explore_every: int = 20, stats_path: Optional[str | Path] = Path(".cache") / "routing_stats.json"):
+        """
+        max_latency_seconds/max_cost_usd: per-document budget (None = unbounded); latency is that of the LLM call.
+        min_accuracy: accuracy a route must have shown for a label to be used.
+        min_accuracy_samples: accuracy samples needed before the accuracy of a route is trusted.
+        explore_every: every N decisions of a label, retry the cheapest route ruled out by its accuracy (0 = never).
+        stats_path: where the learned statistics are persisted between runs (None = memory only).
+        """
+        self.__max_latency = max_latency_seconds
+        self.__max_cost = max_cost_usd
+        self.__min_accuracy = min_accuracy
+        self.__coverage_threshold = coverage_threshold
+        self.__min_accuracy_samples = min_accuracy_samples
+        self.__explore_every = explore_every
+        self.__decisions: Dict[str, int] = dict() # label -> decisions taken by this process
+        self.__stats_path = Path(stats_path) if stats_path is not None else None
+        self.__stats: Dict[str, Dict[str, RouteStats]] = self.__load() or dict() # label -> route name -> stats
+        self.__saved = copy.deepcopy(self.__stats) # Stats as last read from/written to the file
+
+    @classmethod
+    def from_env(cls) -> "RoutingPolicy":
+        """
+        Build the policy from ROUTING_MAX_LATENCY_SECONDS, ROUTING_MAX_COST_USD, ROUTING_MIN_ACCURACY,
+        ROUTING_MIN_ACCURACY_SAMPLES and ROUTING_EXPLORE_EVERY.
+        """
+        def env_float(name: str, default: Optional[float]) -> Optional[float]:
+            value = os.getenv(name)
+            return float(value) if value else default
+
+        return cls(
+            max_latency_seconds=env_float("ROUTING_MAX_LATENCY_SECONDS", None),
+            max_cost_usd=env_float("ROUTING_MAX_COST_USD", None),
+            min_accuracy=env_float("ROUTING_MIN_ACCURACY", 0.9),
+            min_accuracy_samples=int(env_float("ROUTING_MIN_ACCURACY_SAMPLES", 3)),
+            explore_every=int(env_float("ROUTING_EXPLORE_EVERY", 20)),
+        )
+
+    def has_history(self) -> bool:
+        return bool(self.__stats)
+
+    def get_stats(self, label: str, route: Route) -> Optional[RouteStats]:
+        return self.__stats.get(label, dict()).get(route.name)
+
+    def choose(self, label: str, heuristic_coverage: float, text_available: bool = True) -> RoutingDecision:
+        """
+        Pick the route for a document given the fraction of the schema already filled by the heuristic.
+        """
+        decisions = self.__decisions[label] = self.__decisions.get(label, 0) + 1
+        decision = self.__choose(label, heuristic_coverage, text_available)
+
+        # Periodically retry a cheaper route ruled out by its accuracy: without new samples, a route that
+        # did badly once (e.g. on its first documents) would never be used again for the label
+        if self.__explore_every and decisions % self.__explore_every == 0:
+            for route in ROUTES[:ROUTES.index(decision.route)]:
+                if route.mode == TEXT_BASED and not text_available:
+                    continue
+                accuracy = self.__trusted_accuracy(label, route)
+                if accuracy is not None and accuracy < self.__min_accuracy:
+                    return RoutingDecision(route, "exploration of a route below the accuracy threshold")
+        return decision
+
+    def __trusted_accuracy(self, label: str, route: Route) -> Optional[float]:
+        """
+        Mean accuracy of the route, or None while it has fewer than min_accuracy_samples samples.
+        """
+        stats = self.get_stats(label, route)
+        if stats is None or stats.accuracy_count < self.__min_accuracy_samples:
+            return None
+        return stats.mean_accuracy()
+
+    def __choose(self, label: str, heuristic_coverage: float, text_available: bool) -> RoutingDecision:
+        candidates = list()
+        for route in ROUTES:
+            if route.mode == TEXT_BASED and not text_available:
+                continue
+            accuracy = self.__trusted_accuracy(label, route)
+            if accuracy is None:
+                # No accuracy feedback: trust the text path only if the heuristic covers enough of the schema
+                acceptable = route.mode == NATIVE_PDF or heuristic_coverage > self.__coverage_threshold
+            else:
+                acceptable = accuracy >= self.__min_accuracy
+            if acceptable:
+                candidates.append(route)
+
+        if not candidates:
+            return RoutingDecision(FALLBACK_ROUTE, "no route accurate enough")
+
+        within_budget = [route for route in candidates if self.__within_budget(label, route)]
+        if not within_budget:
+            route = min(candidates, key=lambda r: self.__cost_rank(label, r, candidates))
+            return RoutingDecision(route, "no route within budget, cheapest accurate route")
+
+        route = min(within_budget, key=lambda r: self.__cost_rank(label, r, within_budget))
+        return RoutingDecision(route, "cheapest accurate route within budget")
+
+    def observe(self, label: str, route: Route, latency_seconds: Optional[float], cost_usd: float, total_tokens: int,
+                accuracy: Optional[float] = None) -> None:
+        """
+        Update the statistics of a route with the outcome of one LLM extraction.
+        latency_seconds is the latency of the LLM call (None if unknown).
+        """
+        stats = self.__stats.setdefault(label, dict()).setdefault(route.name, RouteStats())
+        stats.count += 1
+        if latency_seconds is not None:
+            stats.latency_count += 1
+            stats.latency_sum += latency_seconds
+        stats.cost_sum += cost_usd
+        stats.tokens_sum += total_tokens
+        if accuracy is not None:
+            stats.accuracy_sum += accuracy
+            stats.accuracy_count += 1
+
+    def observe_record(self, record: dict, accuracy: Optional[float] = None) -> None:
+        """
+        Update the statistics from a results record (as written to results_*.json). Records without
+        LLM usage (fully answered by the heuristic) say nothing about the routes and are ignored.
+        """
+        metadata = record["metadata"]
+        if not metadata.get("total_tokens"):
+            return
+        route = Route(metadata["version_used"], metadata.get("reasoning_effort", "minimal"))
+        # latency_seconds covers the whole document (PDF parsing, heuristic...): only the LLM call latency is used
+        self.observe(metadata["label"], route, metadata.get("llm_latency_seconds"), float(metadata["estimated_cost_usd"]),
+                     metadata["total_tokens"], accuracy)
+
+    def save(self) -> None:
+        """
+        Persist the statistics. Other runs may have saved theirs since this one read the file, so it is
+        read again under a lock and only what this run observed since then is added to it.
+        """
+        if self.__stats_path is None:
+            return
+        with file_lock(self.__stats_path):
+            merged = self.__load()
+            if merged is None: # Unreadable file: this run's stats replace it
+                merged = copy.deepcopy(self.__stats)
+            else:
+                for label, routes in self.__stats.items():
+                    for name, stats in routes.items():
+                        saved = self.__saved.get(label, dict()).get(name, RouteStats())
+                        target = merged.setdefault(label, dict()).setdefault(name, RouteStats())
+                        for field in fields(RouteStats):
+                            delta = getattr(stats, field.name) - getattr(saved, field.name)
+                            setattr(target, field.name, getattr(target, field.name) + delta)
+
+            tmp_path = self.__stats_path.with_suffix(".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({label: {name: vars(stats) for name, stats in routes.items()} for label, routes in merged.items()},
+                          f, indent=4)
+            os.replace(tmp_path, self.__stats_path)
+
+        self.__stats = merged
+        self.__saved = copy.deepcopy(merged)
+
+    def __load(self) -> Optional[Dict[str, Dict[str, RouteStats]]]:
+        """
+        Read the stats file. Returns an empty dict if there is none, None if it can't be read.
+        """
+        if self.__stats_path is None or not self.__stats_path.is_file():
+            return dict()
+        try:
+            with open(self.__stats_path, encoding="utf-8") as f:
+                return {
+                    label: {
+                        # Stats saved before latency_count existed had one latency per record
+                        name: RouteStats(**{"latency_count": values.get("count", 0), **values})
+                        for name, values in routes.items()
+                    }
+                    for label, routes in json.load(f).items()
+                }
+        except (json.JSONDecodeError, OSError, TypeError) as e:
+            logger.warning(f"Couldn't load routing stats from {self.__stats_path}: {e}")
+            return None
+
+    def __within_budget(self, label: str, route: Route) -> bool:
+        stats = self.get_stats(label, route)
+        if stats is None or stats.count == 0: # Unknown: give it a chance
+            return True
+        latency = stats.mean_latency()
+        if self.__max_latency is not None and latency is not None and latency > self.__max_latency:
+            return False
+        if self.__max_cost is not None and stats.mean_cost() > self.__max_cost:
+            return False
+        return True
+
+    def __cost_rank(self, label: str, route: Route, pool: list[Route]) -> tuple:
+        """
+        Order routes by learned mean cost (then latency) when all of the pool has been observed,
+        otherwise by the prior order of ROUTES (cheapest first).
+        """
+        if all(self.get_stats(label, r) for r in pool):
+            stats = self.get_stats(label, route)
+            return (stats.mean_cost(), stats.mean_latency() or 0.0)
+        return (ROUTES.index(route),)